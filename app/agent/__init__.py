@@ -1,5 +1,11 @@
-from .manager import GenerationManager, EmbeddingManager
+from .manager import GenerationManager, EmbeddingManager, provider_registry
 from .resume_service import ResumeService
 from .jd_service import JDService
 
-__all__ = ["GenerationManager", "EmbeddingManager", "ResumeService", "JDService"]
+__all__ = [
+    "GenerationManager",
+    "EmbeddingManager",
+    "provider_registry",
+    "ResumeService",
+    "JDService",
+]
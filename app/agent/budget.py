@@ -0,0 +1,216 @@
+import re
+import math
+import logging
+
+from collections import Counter
+from typing import Optional
+
+
+logger = logging.getLogger(__name__)
+
+# Qwen-style BPE: about one token per CJK character, a few characters per
+# token for latin text. Errs on the high side so budgets are not exceeded.
+CHARS_PER_TOKEN = 3.0
+
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+_IMAGE_RE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+_TABLE_RULE_RE = re.compile(r"^\s*\|?(\s*:?-{3,}:?\s*\|)+\s*:?-{0,}:?\s*\|?\s*$")
+_EMPTY_CELLS_RE = re.compile(r"\|(\s*\|)+")
+# page numbers need a marker ("Page 2", "2 / 5", "- 2 -"), a bare number can be content
+_PAGE_RE = re.compile(
+    r"^\s*((page|trang)\s*\d{1,3}(\s*(/|of)\s*\d{1,3})?|\d{1,3}\s*(/|of)\s*\d{1,3}"
+    r"|-\s*\d{1,3}\s*-)\s*$|^\s*第\s*\d+\s*页",
+    re.IGNORECASE,
+)
+_SPACES_RE = re.compile(r"[ \t\u00a0]+")
+
+_HEADING_RE = re.compile(r"^(#{1,6}\s+\S|\*\*[^*]{1,60}\*\*:?\s*$)")
+_SECTION_WEIGHTS = {
+    "experience": 5,
+    "employment": 5,
+    "work history": 5,
+    "工作": 5,
+    "kinh nghiệm": 5,
+    "skill": 4,
+    "技能": 4,
+    "kỹ năng": 4,
+    "education": 3,
+    "教育": 3,
+    "học vấn": 3,
+    "project": 2,
+    "项目": 2,
+    "dự án": 2,
+    "certif": 2,
+    "证书": 2,
+    "chứng chỉ": 2,
+    "summary": 2,
+    "profile": 2,
+    "objective": 2,
+    "requirement": 4,
+    "responsibilit": 3,
+}
+# a truncated section smaller than this is not worth including
+MIN_PART_TOKENS = 64
+# a long line seen this many times is a page header/footer
+_REPEATED_LINE_MIN = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Fast token count approximation, no tokenizer round trip to Ollama.
+    """
+    if not text:
+        return 0
+
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / CHARS_PER_TOKEN)
+
+
+def clean_text(text: str) -> str:
+    """
+    Drop conversion boilerplate: image references, table rules and empty
+    cells, page numbers, repeated headers/footers and extra whitespace.
+    """
+    cleaned = []
+    for line in _IMAGE_RE.sub("", text).splitlines():
+        if _TABLE_RULE_RE.match(line) or _PAGE_RE.match(line):
+            continue
+        cleaned.append(_SPACES_RE.sub(" ", _EMPTY_CELLS_RE.sub("|", line)).strip())
+
+    # long lines repeated on most pages are headers/footers, keep the first
+    # one. Short ones are labels ("Responsibilities:") that belong to each
+    # entry, a line seen only twice can be a bullet shared by two jobs.
+    counts = Counter(line.lower() for line in cleaned if len(line) > 24)
+
+    lines = []
+    seen = set()
+    for line in cleaned:
+        if line in ("", "|"):
+            if lines and lines[-1] != "":
+                lines.append("")
+            continue
+
+        key = line.lower()
+        if counts[key] >= _REPEATED_LINE_MIN:
+            if key in seen:
+                continue
+            seen.add(key)
+
+        lines.append(line)
+
+    return "\n".join(lines).strip()
+
+
+def _is_heading(line: str) -> bool:
+    if _HEADING_RE.match(line):
+        return True
+
+    plain = line.strip().rstrip(":").strip()
+    if not plain or len(plain) > 40 or len(plain.split()) > 5:
+        return False
+
+    if plain.isupper() and not any(c.isdigit() for c in plain):
+        return True
+
+    lower = plain.lower()
+    return line.strip().endswith(":") and any(k in lower for k in _SECTION_WEIGHTS)
+
+
+def split_sections(text: str) -> list[str]:
+    """
+    Split on markdown headings and heading-like lines, the text before the
+    first heading (name, contact) is the first section.
+    """
+    sections = [[]]
+    for line in text.splitlines():
+        if _is_heading(line) and sections[-1]:
+            sections.append([])
+        sections[-1].append(line)
+
+    return ["\n".join(lines) for lines in sections if lines]
+
+
+def _section_score(section: str, keywords: list[str]) -> float:
+    head = section.split("\n", 1)[0].lower()
+    score = max((w for k, w in _SECTION_WEIGHTS.items() if k in head), default=1)
+
+    if keywords:
+        body = section.lower()
+        score += sum(1 for k in keywords if k in body)
+
+    return score
+
+
+def _cut_line(line: str, max_tokens: int) -> str:
+    """Head of `line` within `max_tokens`, cut at a character boundary"""
+    cut = line[: int(max_tokens * CHARS_PER_TOKEN)]
+    # CJK text has more tokens per character, shrink until it fits
+    while cut and (tokens := estimate_tokens(cut)) > max_tokens:
+        cut = cut[: min(len(cut) - 1, int(len(cut) * max_tokens / tokens))]
+
+    return cut
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    kept = []
+    used = 0
+    for line in text.splitlines():
+        tokens = estimate_tokens(line) + 1
+        if used + tokens > max_tokens:
+            # a long line (a JD description on one line) is cut, not dropped
+            cut = _cut_line(line, max_tokens - used - 1)
+            if cut:
+                kept.append(cut)
+            break
+        kept.append(line)
+        used += tokens
+
+    return "\n".join(kept)
+
+
+def fit_text(text: str, max_tokens: int, keywords: Optional[list[str] | str] = None) -> str:
+    """
+    Clean `text` and, if it is still over `max_tokens`, keep the first section
+    and then the highest scoring ones (section type, `keywords` hits) that fit,
+    in their original order.
+    """
+    text = clean_text(text)
+    total = estimate_tokens(text)
+    if max_tokens <= 0 or total <= max_tokens:
+        return text
+
+    if isinstance(keywords, str):
+        keywords = keywords.split(",")
+    keywords = [k.strip().lower() for k in keywords or [] if k and k.strip()]
+
+    sections = split_sections(text)
+    chosen = {}
+    remaining = max_tokens
+
+    # the header holds the name and contact details, always keep it
+    chosen[0] = _truncate(sections[0], remaining)
+    remaining -= estimate_tokens(chosen[0])
+
+    ranked = sorted(
+        range(1, len(sections)),
+        key=lambda i: _section_score(sections[i], keywords),
+        reverse=True,
+    )
+    # whole sections first, then the head of the ones that did not fit
+    for i in ranked:
+        tokens = estimate_tokens(sections[i]) + 1
+        if tokens <= remaining:
+            chosen[i] = sections[i]
+            remaining -= tokens
+
+    for i in ranked:
+        if remaining < MIN_PART_TOKENS:
+            break
+        if i not in chosen:
+            chosen[i] = _truncate(sections[i], remaining)
+            remaining -= estimate_tokens(chosen[i]) + 1
+
+    result = "\n".join(chosen[i] for i in sorted(chosen) if chosen[i])
+    logger.info(f"Fit text to {max_tokens} tokens: {total} -> {estimate_tokens(result)}")
+
+    return result
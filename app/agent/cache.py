@@ -0,0 +1,364 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+import numpy as np
+
+from collections import OrderedDict
+from typing import Any, Optional
+from fastapi.concurrency import run_in_threadpool
+
+from ..core import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+def sha256_hex(*parts: str | bytes) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        h.update(part)
+        h.update(b"\x00")
+
+    return h.hexdigest()
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory LRU cache with hit/miss counters.
+
+    Bounded by `max_entries`, and by `max_bytes` when a `size_of` function is
+    given to measure each value.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int = 0, size_of=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_of = size_of
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._data: OrderedDict[str, Any] = OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self._bytes = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+
+    def set(self, key: str, value: Any):
+        size = self.size_of(value) if self.size_of else 0
+        if self.max_bytes and size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._bytes += size - self._sizes.get(key, 0)
+            self._sizes[key] = size
+            self._data[key] = value
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.max_entries or (
+                self.max_bytes and self._bytes > self.max_bytes
+            ):
+                old_key, _ = self._data.popitem(last=False)
+                self._bytes -= self._sizes.pop(old_key)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class SqliteCache:
+    """
+    Small persistent key/value cache on a local SQLite file.
+
+    * Entries expire after `ttl` seconds (0 disables expiry)
+    * When more than `max_entries` rows are stored, the least recently used
+      ones are evicted
+    * Hit/miss counters are kept in memory for the current process
+    """
+
+    def __init__(self, path: str, table: str, ttl: float = 0, max_entries: int = 0):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value BLOB, expires_at REAL, accessed_at REAL)"
+        )
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed_at)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None or (row[1] and row[1] < now):
+                if row is not None:
+                    self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+
+            return row[0]
+
+    def set(self, key: str, value: bytes):
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else None
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now),
+            )
+            self._writes += 1
+            # checking the size on every write is wasteful, do it periodically
+            if self.max_entries and self._writes % 100 == 0:
+                self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        self._conn.execute(
+            f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at < ?",
+            (now,),
+        )
+        (count,) = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN ("
+                f"SELECT key FROM {self.table} ORDER BY accessed_at LIMIT ?)",
+                (overflow,),
+            )
+            self.evictions += overflow
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class ReviewCache:
+    """
+    LLM review results keyed by (JD text, CV id + content, model, prompt version).
+    """
+
+    def __init__(self):
+        self._cache: Optional[SqliteCache] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.REVIEW_CACHE_PATH)
+
+    def _get_cache(self) -> SqliteCache:
+        with self._lock:
+            if self._cache is None:
+                self._cache = SqliteCache(
+                    settings.REVIEW_CACHE_PATH,
+                    "review",
+                    ttl=settings.REVIEW_CACHE_TTL,
+                    max_entries=settings.REVIEW_CACHE_MAX_ENTRIES,
+                )
+
+        return self._cache
+
+    @staticmethod
+    def make_key(
+        jd_text: str,
+        jd_keywords: Any,
+        cv_id: str,
+        cv_content: str,
+        cv_keywords: str,
+        model: str,
+        prompt_version: str,
+    ) -> str:
+        jd_hash = sha256_hex(jd_text, str(jd_keywords))
+        cv_hash = sha256_hex(cv_content or "", cv_keywords or "")
+
+        return sha256_hex(jd_hash, str(cv_id), cv_hash, model or "", prompt_version)
+
+    async def get(self, key: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+
+        value = await run_in_threadpool(self._get_cache().get, key)
+        if value is None:
+            return None
+
+        return json.loads(value)
+
+    async def set(self, key: str, value: dict):
+        if not self.enabled:
+            return
+
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        await run_in_threadpool(self._get_cache().set, key, data)
+
+    def stats(self) -> dict:
+        if not self.enabled or self._cache is None:
+            return {"enabled": self.enabled}
+
+        return {"enabled": True, **self._cache.stats()}
+
+
+class EmbeddingCache:
+    """
+    Content addressed embeddings: an in-memory LRU in front of an optional
+    SQLite store of float32 vectors. Keys cover the model, dimensions, task,
+    query flag and the text itself.
+    """
+
+    def __init__(self):
+        self.memory = LRUCache(settings.EMBEDDING_CACHE_SIZE)
+        self._disk: Optional[SqliteCache] = None
+        self._lock = threading.Lock()
+
+    def _get_disk(self) -> Optional[SqliteCache]:
+        if not settings.EMBEDDING_CACHE_PATH:
+            return None
+
+        with self._lock:
+            if self._disk is None:
+                self._disk = SqliteCache(
+                    settings.EMBEDDING_CACHE_PATH,
+                    "embedding",
+                    max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+                )
+
+        return self._disk
+
+    @staticmethod
+    def make_key(model: str, dimensions: int, task: str, query: bool, text: str) -> str:
+        return sha256_hex(model, str(dimensions), task or "", str(bool(query)), text)
+
+    def get(self, key: str) -> Optional[list[float]]:
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+
+        disk = self._get_disk()
+        if disk is None:
+            return None
+
+        data = disk.get(key)
+        if data is None:
+            return None
+
+        value = np.frombuffer(data, dtype=np.float32).tolist()
+        self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: list[float]):
+        self.memory.set(key, value)
+
+        disk = self._get_disk()
+        if disk is not None:
+            disk.set(key, np.asarray(value, dtype=np.float32).tobytes())
+
+    def stats(self) -> dict:
+        stats = {"memory": self.memory.stats()}
+        if self._disk is not None:
+            stats["disk"] = self._disk.stats()
+
+        return stats
+
+
+def _converted_size(value: str | list[str] | dict) -> int:
+    if isinstance(value, str):
+        return len(value)
+
+    if isinstance(value, dict):
+        return sum(_converted_size(v) for v in value.values())
+
+    return sum(len(v) for v in value)
+
+
+class ConversionCache:
+    """
+    Converted documents (markdown text or base64 page images) keyed by the
+    SHA-256 of the raw bytes and the converter mode, bounded in bytes.
+    """
+
+    def __init__(self):
+        self.memory = LRUCache(
+            max_entries=settings.CONVERT_CACHE_MAX_ENTRIES,
+            max_bytes=settings.CONVERT_CACHE_MAX_BYTES,
+            size_of=_converted_size,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return settings.CONVERT_CACHE_MAX_BYTES > 0
+
+    @staticmethod
+    def make_key(data: bytes, mode: str, file_suffix: Optional[str]) -> str:
+        return sha256_hex(hashlib.sha256(data).digest(), mode, file_suffix or "")
+
+    def get(self, key: str) -> Optional[str | list[str]]:
+        if not self.enabled:
+            return None
+
+        return self.memory.get(key)
+
+    def set(self, key: str, value: str | list[str]):
+        if self.enabled:
+            self.memory.set(key, value)
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, **self.memory.stats()}
+
+
+review_cache = ReviewCache()
+embedding_cache = EmbeddingCache()
+conversion_cache = ConversionCache()
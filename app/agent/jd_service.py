@@ -1,25 +1,65 @@
+import asyncio
 import logging
 import traceback
 import re
 import os
 from datetime import datetime, timezone, timedelta
-from elasticsearch import Elasticsearch, AsyncElasticsearch
-
-from .manager import GenerationManager, EmbeddingManager
-from .utils import convert_jd_format
-from .providers.prompt.jd_prompt import PROMPT, SYSTEM, TASK
-from .providers.prompt.resume_review import PROMPT_REVIEW, SYSTEM_REVIEW
+from typing import Optional
+from elasticsearch import AsyncElasticsearch
+
+from .providers import ExtractionProvider, EmbeddingProvider
+from ..core import settings
+from .utils import parse_years_of_experience
+from .cache import review_cache, sha256_hex
+from .ranking import reciprocal_rank_fusion, weighted_fusion, pre_rank
+from .budget import fit_text
+from .providers.prompt.jd_prompt import PROMPT, SCHEMA, SYSTEM, TASK
+from .providers.prompt.resume_review import (
+    PROMPT_REVIEW,
+    PROMPT_REVIEW_CV,
+    PROMPT_REVIEW_JD,
+    SCHEMA_REVIEW,
+    SYSTEM_REVIEW,
+)
 
 
 logger = logging.getLogger(__name__)
 
+# cached reviews are invalidated whenever the review prompt or budgets change
+REVIEW_PROMPT_VERSION = sha256_hex(
+    SYSTEM_REVIEW,
+    PROMPT_REVIEW,
+    str(settings.REVIEW_JD_MAX_TOKENS),
+    str(settings.REVIEW_RESUME_MAX_TOKENS),
+)[:16]
+
+# large CV fields matching and review do not read, vectors are fetched separately
+_CV_SOURCE_EXCLUDES = ["embedding_vector", "info_extract", "info_extract_raw"]
+
+# at most REVIEW_CONCURRENCY generations in flight over all JDs of the process,
+# match ollama slots. Created on first use, inside the running event loop
+_review_sem: Optional[asyncio.Semaphore] = None
+
+
+def _review_semaphore() -> asyncio.Semaphore:
+    global _review_sem
+    if _review_sem is None:
+        _review_sem = asyncio.Semaphore(settings.REVIEW_CONCURRENCY)
+
+    return _review_sem
+
 
 class JDService:
-    def __init__(self):
-        self.generation_manager = GenerationManager()
-        self.embedding_manager = EmbeddingManager()
+    def __init__(
+        self,
+        model_gen: ExtractionProvider,
+        model_emb: EmbeddingProvider,
+        es_client: AsyncElasticsearch,
+    ):
+        self.model_gen = model_gen
+        self.model_emb = model_emb
 
-        self.es_client = AsyncElasticsearch(hosts=[os.environ["ES_HOST"]])
+        self.es_client = es_client
         self.jd_index_name = os.environ["ES_JD_INDEX"]
         self.search_result_index_name = os.environ["ES_SEARCH_RESULT_INDEX"]
         self.cv_index_name = os.environ["ES_CV_INDEX"]
@@ -28,7 +68,7 @@ class JDService:
         self.timezone = timezone(timedelta(hours=8))
 
     async def _store_jd(self, gen_res, emb_res, file_name, jd_id, jd_text):
-        minimum_years_of_experience = gen_res["minimum_years_of_experience"]
+        minimum_years_of_experience = gen_res.get("minimum_years_of_experience")
         if minimum_years_of_experience:
             match = re.search(r"\d+", str(minimum_years_of_experience))
             if match:
@@ -38,11 +78,11 @@ class JDService:
             "id": jd_id,
             "jd_url": file_name,
             "content": jd_text,
-            "keywords": ", ".join(gen_res["extracted_keywords"]),
-            "job_name": gen_res["job_name"],
-            "job_description": gen_res["job_description"],
+            "keywords": ", ".join(gen_res.get("extracted_keywords") or []),
+            "job_name": gen_res.get("job_name"),
+            "job_description": gen_res.get("job_description"),
             "minimum_years_of_experience": minimum_years_of_experience,
-            "required_skills": gen_res["required_skills"],
+            "required_skills": gen_res.get("required_skills"),
             "embedding_vector": emb_res,
             "created_at": datetime.now(self.timezone).isoformat(),
         }
@@ -55,6 +95,29 @@ class JDService:
         resp = await self.es_client.index(index=self.search_result_index_name, document=doc) # fmt:skip
         logger.info(resp)
 
+    async def _fetch_vectors(self, cv_list: list[dict]):
+        """
+        Add `embedding_vector` to the `_source` of the fused hits, the searches
+        never return it so only these few vectors are transferred.
+        """
+        if not cv_list:
+            return
+
+        try:
+            response = await self.es_client.mget(
+                docs=[{"_index": hit["_index"], "_id": hit["_id"]} for hit in cv_list],
+                source_includes=["embedding_vector"],
+            )
+        except Exception as e:
+            # pre-ranking falls back to the keyword score
+            logger.error(f"Fetching CV vectors failed: {e}")
+            return
+
+        for hit, doc in zip(cv_list, response["docs"]):
+            vector = doc.get("_source", {}).get("embedding_vector")
+            if vector is not None:
+                hit["_source"]["embedding_vector"] = vector
+
     async def _keywords_search(self, keywords, job_name, size=5):
         # query = {
         #     "_source": {"excludes": ["embedding_vector"]},
@@ -65,7 +128,7 @@ class JDService:
         logger.info(f"Query content: {query_content}")
 
         query = {
-            "_source": {"excludes": ["embedding_vector"]},
+            "_source": {"excludes": _CV_SOURCE_EXCLUDES},
             "size": size,
             "query": {
                 "multi_match": {
@@ -78,49 +141,127 @@ class JDService:
 
         return response["hits"]["hits"]
 
-    async def _vectors_search(self, query_vector: list, size=5):
+    @staticmethod
+    def _experience_filter(min_years: float) -> dict:
+        # CVs without a parsed year_of_experience are kept
+        return {
+            "bool": {
+                "should": [
+                    {"range": {"year_of_experience": {"gte": min_years}}},
+                    {"bool": {"must_not": {"exists": {"field": "year_of_experience"}}}},
+                ]
+            }
+        }
+
+    async def _vectors_search(
+        self, query_vector: list, size=5, filters: Optional[list[dict]] = None
+    ):
+        k = settings.ES_KNN_K or size
+        knn = {
+            "field": "embedding_vector",
+            "query_vector": query_vector,
+            "k": k,
+            # ES rejects num_candidates < k
+            "num_candidates": max(settings.ES_KNN_NUM_CANDIDATES, k),
+        }
+        if filters:
+            knn["filter"] = filters
+
         response = await self.es_client.search(
             index=self.cv_index_name,
             body={
-                "_source": {"excludes": ["embedding_vector"]},
+                "_source": {"excludes": _CV_SOURCE_EXCLUDES},
                 "size": size,
-                "query": {
-                    "script_score": {
-                        "query": {"match_all": {}},
-                        "script": {
-                            "source": "cosineSimilarity(params.query_vector, 'embedding_vector') + 1.0",
-                            "params": {"query_vector": query_vector},
-                        },
-                    }
-                },
+                "knn": knn,
             },
         )
 
         return response["hits"]["hits"]
 
-    async def match(self, keywords, vector, job_name):
-        keywords_search_res = await self._keywords_search(keywords, job_name)
-        # vectors_search_res = await self._vectors_search(vector)
+    async def match(self, keywords, vector, job_name, min_years=None):
+        size = settings.RETRIEVAL_CANDIDATES
+        filters = [self._experience_filter(min_years)] if min_years else None
+        searches = await asyncio.gather(
+            self._keywords_search(keywords, job_name, size=size),
+            self._vectors_search(vector, size=size, filters=filters),
+            return_exceptions=True,
+        )
+
+        result_lists = []
+        for name, res in zip(("keywords", "vectors"), searches):
+            if isinstance(res, BaseException):
+                logger.error(f"{name} search failed: {res}")
+                res = []
+            result_lists.append(res)
+
+        if settings.RETRIEVAL_FUSION == "weighted":
+            cv_list = weighted_fusion(
+                result_lists,
+                [settings.RETRIEVAL_KEYWORD_WEIGHT, settings.RETRIEVAL_VECTOR_WEIGHT],
+            )
+        else:
+            cv_list = reciprocal_rank_fusion(result_lists, k=settings.RETRIEVAL_RRF_K)
 
-        # cv_list = []
-        # for hit in vectors_search_res:
-        #     cv_list.append(hit)
+        return cv_list[: settings.RETRIEVAL_SIZE]
 
-        return keywords_search_res
+    async def _review_one(
+        self, semaphore, jd_prompt, jd_content, jd_keywords, resume: dict
+    ):
+        source = resume["_source"]
+        cache_key = review_cache.make_key(
+            jd_content,
+            jd_keywords,
+            source.get("id"),
+            source["content"],
+            source["keywords"],
+            settings.LL_MODEL,
+            REVIEW_PROMPT_VERSION,
+        )
 
-    async def review(self, model_gen, jd_content, jd_keywords, cv_list: list[dict]):
-        results = []
+        gen_res = await review_cache.get(cache_key)
+        if gen_res is not None:
+            return {**resume, **gen_res}
+
+        # shared JD prefix first, only the resume part differs between calls
+        prompt = jd_prompt + PROMPT_REVIEW_CV.format(
+            # the sections most relevant to the JD keywords when over budget
+            raw_resume=fit_text(
+                source["content"], settings.REVIEW_RESUME_MAX_TOKENS, jd_keywords
+            ),
+            extracted_resume_keywords=source["keywords"],
+        )
+
+        async with semaphore:
+            gen_res, _ = await self.model_gen(
+                "", prompt, SYSTEM_REVIEW, None, schema=SCHEMA_REVIEW
+            )
 
-        for resume in cv_list:
-            prompt = PROMPT_REVIEW.format(
-                raw_job_description=jd_content,
-                extracted_job_keywords=jd_keywords,
-                raw_resume=resume["_source"]["content"],
-                extracted_resume_keywords=resume["_source"]["keywords"],
+        # only keep well-formed reviews, a failed parse should be retried
+        if "match_score" in gen_res:
+            await review_cache.set(cache_key, gen_res)
+
+        return {**resume, **gen_res}
+
+    async def review(self, jd_content, jd_keywords, cv_list: list[dict]):
+        semaphore = _review_semaphore()
+        jd_prompt = PROMPT_REVIEW_JD.format(
+            raw_job_description=fit_text(jd_content, settings.REVIEW_JD_MAX_TOKENS),
+            extracted_job_keywords=jd_keywords,
+        )
+        tasks = [
+            asyncio.create_task(
+                self._review_one(semaphore, jd_prompt, jd_content, jd_keywords, resume)
             )
+            for resume in cv_list
+        ]
 
-            gen_res, _ = await model_gen("", prompt, SYSTEM_REVIEW, None)
-            results.append({**resume, **gen_res})
+        results = []
+        for task in asyncio.as_completed(tasks):
+            try:
+                results.append(await task)
+            except Exception:
+                logger.info("Review candidate failed!!!!!!")
+                logger.error(traceback.format_exc())
 
         return results
 
@@ -156,9 +297,6 @@ class JDService:
         if isinstance(contents, dict):
             contents = await self._pre_data(contents)
 
-        model_gen = await self.generation_manager.init_model()
-        model_emb = await self.embedding_manager.init_model()
-
         if prompt is None:
             prompt = PROMPT
 
@@ -166,26 +304,51 @@ class JDService:
             suffix = "." + file_name.split(".")[-1]
         else:
             suffix = None
-        gen_res, jd_text = await model_gen(contents, prompt, SYSTEM, suffix)
+        gen_res, jd_text = await self.model_gen(
+            contents, prompt, SYSTEM, suffix, schema=SCHEMA
+        )
 
         # gen_res_format = convert_jd_format(gen_res)
-        emb_res = await model_emb([jd_text], TASK, query=True)
+        emb_res = await self.model_emb([jd_text], TASK, query=True)
 
-        if gen_res["extracted_keywords"]:
+        cv_top_k_review = []
+        keywords = gen_res.get("extracted_keywords") or []
+        if keywords:
+            min_years = parse_years_of_experience(
+                gen_res.get("minimum_years_of_experience")
+            )
             cv_matcher = await self.match(
-                keywords=", ".join(gen_res["extracted_keywords"]),
+                keywords=", ".join(keywords),
                 vector=emb_res[0],
-                job_name=gen_res["job_name"],
+                job_name=gen_res.get("job_name") or "",
+                min_years=min_years,
             )
 
+            if settings.PRERANK_ENABLED:
+                await self._fetch_vectors(cv_matcher)
+                cv_matcher = pre_rank(
+                    cv_matcher,
+                    emb_res[0],
+                    keywords,
+                    top_n=settings.REVIEW_TOP_N,
+                    min_years=min_years,
+                    vector_weight=settings.PRERANK_VECTOR_WEIGHT,
+                    keyword_weight=settings.PRERANK_KEYWORD_WEIGHT,
+                    experience_tolerance=settings.PRERANK_EXPERIENCE_TOLERANCE,
+                )
+
             cv_top_k_review = await self.review(
-                model_gen, jd_text, gen_res["extracted_keywords"], cv_matcher
+                jd_text, keywords, cv_matcher
             )
 
             cv_top_k_review = sorted(
-                cv_top_k_review, key=lambda person: person["match_score"], reverse=True
+                cv_top_k_review,
+                key=lambda person: person.get("match_score", 0),
+                reverse=True,
             )
-            cv_top_k_review = [v for v in cv_top_k_review if v["match_score"] >= 20]
+            cv_top_k_review = [
+                v for v in cv_top_k_review if v.get("match_score", 0) >= 20
+            ]
 
             top_cv_id = []
             for v in cv_top_k_review:
@@ -197,7 +360,6 @@ class JDService:
                 try:
                     await self._store_jd(gen_res, emb_res[0], file_name, jd_id, jd_text)
                     await self._store_search_result(top_cv_id, jd_id)
-                    await self.es_client.close()
 
                 except:
                     logger.info("Save data failed!!!!!!")
@@ -206,13 +368,11 @@ class JDService:
         else:
             logger.info("Can not get extracted keywords")
 
-        await self.es_client.close()
         return gen_res, cv_top_k_review
 
 
 if __name__ == "__main__":
     import asyncio
-    import numpy as np
 
     service = JDService()
     print(service.cv_index_name)
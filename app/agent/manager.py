@@ -1,9 +1,16 @@
-import os
+import asyncio
+import logging
+import threading
+
+from fastapi.concurrency import run_in_threadpool
 
 from .providers import ExtractionProvider, EmbeddingProvider
 from ..core import settings
 
 
+logger = logging.getLogger(__name__)
+
+
 class GenerationManager:
     def __init__(self):
         self.model_provider = settings.LLM_PROVIDER
@@ -12,9 +19,7 @@ class GenerationManager:
         self.torch_dtype = settings.TORCH_DTYPE
         self.use_vision = settings.USE_VISION
 
-    async def init_model(self) -> ExtractionProvider:
-        otps = {}
-
+    def create_model(self) -> ExtractionProvider:
         if self.model_provider == "ollama":
             from .providers import OllamaExtractionProvider
 
@@ -24,6 +29,9 @@ class GenerationManager:
 
         #     return TorchExtractionProvider(self.model_path, self.torch_dtype, self.use_vision)
 
+    async def init_model(self) -> ExtractionProvider:
+        return await run_in_threadpool(self.create_model)
+
 
 class EmbeddingManager:
     def __init__(self):
@@ -32,8 +40,53 @@ class EmbeddingManager:
         # self.model_path = settings.LL_MODEL_CKPT_PATH
         # self.torch_dtype = settings.TORCH_DTYPE
 
-    async def init_model(self) -> EmbeddingProvider:
+    def create_model(self) -> EmbeddingProvider:
         if self.model_provider == "ollama":
             from .providers import OllamaEmbeddingProvider
 
             return OllamaEmbeddingProvider(self.model_name)
+
+    async def init_model(self) -> EmbeddingProvider:
+        return await run_in_threadpool(self.create_model)
+
+
+class ProviderRegistry:
+    """
+    Process-wide holder of the generation/embedding providers.
+
+    Each provider (and its Ollama client, MarkItDown instance and installed
+    model check) is built once on first use and the same instance is handed
+    out afterwards. Providers keep no per-request state, so they are safe to
+    share between requests and worker threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._model_gen = None
+        self._model_emb = None
+        self._checked = False
+
+    def _create_models(self):
+        with self._lock:
+            if self._model_gen is None:
+                self._model_gen = GenerationManager().create_model()
+            if self._model_emb is None:
+                self._model_emb = EmbeddingManager().create_model()
+
+        return self._model_gen, self._model_emb
+
+    async def init_model(self) -> tuple[ExtractionProvider, EmbeddingProvider]:
+        if self._model_gen is None or self._model_emb is None:
+            logger.info("Loading providers ....")
+            await run_in_threadpool(self._create_models)
+
+        if not self._checked:
+            await asyncio.gather(
+                self._model_gen.check_model(), self._model_emb.check_model()
+            )
+            self._checked = True
+
+        return self._model_gen, self._model_emb
+
+
+provider_registry = ProviderRegistry()
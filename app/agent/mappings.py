@@ -0,0 +1,86 @@
+import logging
+
+from elasticsearch import AsyncElasticsearch
+
+from ..core import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+_STORED_ONLY = {
+    "info_extract": {"type": "object", "enabled": False},
+    "info_extract_raw": {"type": "object", "enabled": False},
+}
+
+
+def _vector_index_options() -> dict:
+    options = {"type": settings.ES_VECTOR_INDEX_TYPE}
+    # graph parameters only exist for hnsw, int8_hnsw, bbq_hnsw, ...
+    if settings.ES_VECTOR_INDEX_TYPE.endswith("hnsw"):
+        options["m"] = settings.ES_HNSW_M
+        options["ef_construction"] = settings.ES_HNSW_EF_CONSTRUCTION
+
+    return options
+
+
+def cv_index_mapping() -> dict:
+    return {
+        "properties": {
+            "id": {"type": "keyword"},
+            "cv_url": {"type": "keyword"},
+            "content": {"type": "text"},
+            "keywords": {"type": "text"},
+            "year_of_experience": {"type": "float"},
+            "embedding_vector": {
+                "type": "dense_vector",
+                "dims": settings.EMBEDDING_DIMENSIONS,
+                "index": True,
+                "similarity": "cosine",
+                "index_options": _vector_index_options(),
+            },
+            "full_name": {"type": "text"},
+            "desired_position": {"type": "text"},
+            "created_at": {"type": "date"},
+            "updated_at": {"type": "date"},
+            # stored only, kept for re-running the format conversion
+            **_STORED_ONLY,
+        }
+    }
+
+
+def versioned_index_name(alias: str, version: int) -> str:
+    return f"{alias}-v{version}"
+
+
+async def ensure_cv_index(es_client: AsyncElasticsearch, index_name: str):
+    """
+    Create the CV index with an HNSW indexed `embedding_vector` if it does not
+    exist yet. Existing indices are left untouched, only checked.
+
+    New indices are versioned (`<name>-v1`) behind the alias `index_name`, so
+    `python -m app.reembed` can rebuild them and swap the alias.
+    """
+    if not await es_client.indices.exists(index=index_name):
+        versioned = versioned_index_name(index_name, 1)
+        logger.info(f"Creating index {versioned} with alias {index_name}")
+        await es_client.indices.create(
+            index=versioned, mappings=cv_index_mapping(), aliases={index_name: {}}
+        )
+        return
+
+    mapping = await es_client.indices.get_mapping(index=index_name)
+    for name, index_mapping in mapping.items():
+        properties = index_mapping["mappings"].get("properties", {})
+        missing = {k: v for k, v in _STORED_ONLY.items() if k not in properties}
+        if missing:
+            # before the first document maps them dynamically
+            logger.info(f"Adding {list(missing)} to {name}")
+            await es_client.indices.put_mapping(index=name, properties=missing)
+
+        vector = properties.get("embedding_vector", {})
+        if vector.get("type") != "dense_vector" or vector.get("index") is False:
+            logger.warning(
+                f"{name}.embedding_vector is not an indexed dense_vector, "
+                "knn search will fail, reindex with the current mapping"
+            )
@@ -1,20 +1,31 @@
-from io import BytesIO
-import base64
-import tempfile
+import logging
 import re
 
-from pdf2image import convert_from_bytes
-from PIL import Image
 from markitdown import MarkItDown
 
 from typing import Optional
 from abc import ABC, abstractmethod
 
+from .converter import (
+    MODE_ADAPTIVE,
+    MODE_MARKITDOWN,
+    MODE_VISION,
+    convert_document,
+    convert_document_async,
+)
+from ..cache import conversion_cache
+
+
+logger = logging.getLogger(__name__)
+
 
 def remove_image_special(text):
     text = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL).strip()
 
-    ch_special = ["<ref>", "<ref>", "```", "json"]
+    # only drop the code fence, "json" can be part of the extracted values
+    text = re.sub(r"```(?:json)?", "", text)
+
+    ch_special = ["<ref>", "</ref>"]
     for ch in ch_special:
         text = text.replace(ch, "")
 
@@ -23,22 +34,6 @@ def remove_image_special(text):
     return re.sub(r"<box>.*?(</box>|$)", "", text)
 
 
-def encode_image(pil_image: Image.Image):
-    buffer = BytesIO()
-    pil_image.save(buffer, format="JPEG")
-    return base64.b64encode(buffer.getvalue()).decode("utf-8")
-
-
-def convert_pdf_to_img_base64(pdf_bytes: bytes) -> list[str]:
-    imgs = convert_from_bytes(pdf_bytes)
-
-    base64_imgs = []
-    for img in imgs:
-        base64_imgs.append(encode_image(img))
-
-    return base64_imgs
-
-
 class ExtractionProvider(ABC):
     """
     Abstract base class for providers.
@@ -46,36 +41,62 @@ class ExtractionProvider(ABC):
 
     def __init__(self, use_vision: int):
         self.use_vision = False
+        # USE_VISION=2: text extraction, vision only for scanned pages
+        self.adaptive_vision = use_vision == 2
 
         if use_vision == 1:
             self.use_vision = True
         else:
             self.use_vision = False
-            self.md = MarkItDown(enable_plugins=False)
-
-    def convert_data(self, data: bytes|str, file_suffix: str):
-        if self.use_vision:
-            return convert_pdf_to_img_base64(data)
 
-        if isinstance(data, str):
-            return data
+    @property
+    def convert_mode(self) -> str:
+        if self.adaptive_vision:
+            return MODE_ADAPTIVE
+        return MODE_VISION if self.use_vision else MODE_MARKITDOWN
 
-        if isinstance(data, bytes) and file_suffix:
-            with tempfile.NamedTemporaryFile(
-                delete=False, suffix=file_suffix
-            ) as temp_file:
-                temp_file.write(data)
-                temp_file.flush()
-                temp_path = temp_file.name
-
-                return self.md.convert(temp_path).text_content
-            
-        raise TypeError("resume_data is not valid type")
+    def convert_data(self, data: bytes|str, file_suffix: str):
+        if isinstance(data, bytes):
+            cache_key = conversion_cache.make_key(data, self.convert_mode, file_suffix)
+            converted = conversion_cache.get(cache_key)
+            if converted is not None:
+                return converted
+
+            converted = convert_document(data, file_suffix, self.convert_mode)
+            conversion_cache.set(cache_key, converted)
+            return converted
+
+        return convert_document(data, file_suffix, self.convert_mode)
+
+    async def aconvert_data(self, data: bytes|str, file_suffix: str):
+        """
+        Same as `convert_data`, run on the conversion process pool when
+        CONVERT_WORKERS > 0, otherwise on a worker thread.
+        """
+        if isinstance(data, bytes):
+            cache_key = conversion_cache.make_key(data, self.convert_mode, file_suffix)
+            converted = conversion_cache.get(cache_key)
+            if converted is not None:
+                return converted
+
+            converted = await convert_document_async(data, file_suffix, self.convert_mode)
+            conversion_cache.set(cache_key, converted)
+            return converted
+
+        return data
+
+    async def check_model(self):
+        """Raise if the configured model can not be served"""
 
     @abstractmethod
     async def __call__(
-        self, resume_data: bytes, prompt: Optional[str], file_suffix: str
-    ) -> str: ...
+        self,
+        resume_data: bytes,
+        prompt: Optional[str],
+        sys_mess: str,
+        file_suffix: str,
+        schema: Optional[dict] = None,
+    ) -> tuple[dict, str]: ...
 
 
 class EmbeddingProvider(ABC):
@@ -86,5 +107,8 @@ class EmbeddingProvider(ABC):
     def __init__(self):
         self.md = MarkItDown(enable_plugins=False)
 
+    async def check_model(self):
+        """Raise if the configured model can not be served"""
+
     @abstractmethod
     async def __call__(self, resume_data: str, query: bool = False) -> list[float]: ...
@@ -0,0 +1,242 @@
+"""
+Document conversion (markdown text or base64 page images).
+
+Conversion is CPU bound, so it can run on a process pool of CONVERT_WORKERS
+processes, each keeping its own warm MarkItDown instance, while the LLM calls
+stay on I/O threads.
+"""
+import asyncio
+import base64
+import logging
+import multiprocessing
+import tempfile
+import threading
+
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from pdf2image import convert_from_bytes
+from PIL import Image
+from pypdf import PdfReader
+from markitdown import MarkItDown, StreamInfo
+from fastapi.concurrency import run_in_threadpool
+
+from .exceptions import GenerationError
+from .qwen_vl_utils import smart_resize
+from ...core import settings
+
+
+logger = logging.getLogger(__name__)
+
+MODE_MARKITDOWN = "markitdown"
+MODE_VISION = "vision"
+# markdown text, plus page images only for scanned / near-empty PDF pages
+MODE_ADAPTIVE = "adaptive"
+
+# one MarkItDown per process, created by the pool initializer or on first use
+_md: Optional[MarkItDown] = None
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def encode_image(pil_image: Image.Image):
+    buffer = BytesIO()
+    pil_image.save(buffer, format="JPEG")
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+def _page_target_size(page, dpi: int) -> tuple[int, int]:
+    """
+    (width, height) in pixels of a rendered page, resized to the vision model
+    pixel budget.
+    """
+    width = float(page.mediabox.width) * dpi / 72
+    height = float(page.mediabox.height) * dpi / 72
+    if (page.rotation or 0) % 180 == 90:
+        width, height = height, width
+
+    height, width = smart_resize(
+        int(height),
+        int(width),
+        min_pixels=settings.VISION_MIN_PIXELS,
+        max_pixels=settings.VISION_MAX_PIXELS,
+    )
+    return width, height
+
+
+def iter_pdf_pages_base64(pdf_bytes: bytes, page_numbers: Optional[list[int]] = None):
+    """
+    Yield each page (all, or the 1-based `page_numbers`) as a base64 JPEG, one
+    page rendered at a time.
+
+    poppler writes the JPEG directly at the target size, so only the current
+    page is held in memory. At most VISION_MAX_PAGES pages are rendered.
+    """
+    reader = PdfReader(BytesIO(pdf_bytes))
+    if page_numbers is None:
+        page_numbers = list(range(1, len(reader.pages) + 1))
+
+    if len(page_numbers) > settings.VISION_MAX_PAGES:
+        logger.info(f"Only rendering {settings.VISION_MAX_PAGES} of {len(page_numbers)} pages")
+        page_numbers = page_numbers[: settings.VISION_MAX_PAGES]
+
+    for page_number in page_numbers:
+        size = _page_target_size(reader.pages[page_number - 1], settings.VISION_DPI)
+        with tempfile.TemporaryDirectory() as output_folder:
+            paths = convert_from_bytes(
+                pdf_bytes,
+                dpi=settings.VISION_DPI,
+                first_page=page_number,
+                last_page=page_number,
+                fmt="jpeg",
+                jpegopt={"quality": settings.VISION_JPEG_QUALITY},
+                size=size,
+                output_folder=output_folder,
+                paths_only=True,
+            )
+            for path in paths:
+                with open(path, "rb") as f:
+                    yield base64.b64encode(f.read()).decode("utf-8")
+
+
+def convert_pdf_to_img_base64(pdf_bytes: bytes) -> list[str]:
+    return list(iter_pdf_pages_base64(pdf_bytes))
+
+
+def find_sparse_pages(pdf_bytes: bytes) -> tuple[list[int], int]:
+    """
+    1-based numbers of the pages whose extractable text is shorter than
+    ADAPTIVE_MIN_PAGE_CHARS (scanned or image-only pages), and the page count.
+    """
+    reader = PdfReader(BytesIO(pdf_bytes))
+
+    sparse = []
+    for page_number, page in enumerate(reader.pages, start=1):
+        try:
+            text = page.extract_text() or ""
+        except Exception:
+            text = ""
+        if len("".join(text.split())) < settings.ADAPTIVE_MIN_PAGE_CHARS:
+            sparse.append(page_number)
+
+    return sparse, len(reader.pages)
+
+
+def convert_adaptive(data: bytes, file_suffix: str) -> dict:
+    """
+    Text first, vision only where needed: returns the markdown of the whole
+    document and base64 images of its sparse PDF pages.
+    """
+    if file_suffix != ".pdf":
+        return {"text": convert_to_markdown(data, file_suffix), "images": []}
+
+    sparse, num_pages = find_sparse_pages(data)
+    text = convert_to_markdown(data, file_suffix) if len(sparse) < num_pages else ""
+    images = list(iter_pdf_pages_base64(data, sparse)) if sparse else []
+    logger.info(f"Adaptive conversion: {len(sparse)} of {num_pages} pages rasterized")
+
+    return {"text": text, "images": images}
+
+
+def _get_markitdown() -> MarkItDown:
+    global _md
+    if _md is None:
+        _md = MarkItDown(enable_plugins=False)
+
+    return _md
+
+
+def convert_to_markdown(data: bytes, file_suffix: str) -> str:
+    md = _get_markitdown()
+    try:
+        with BytesIO(data) as stream:
+            return md.convert_stream(
+                stream, stream_info=StreamInfo(extension=file_suffix)
+            ).text_content
+
+    except Exception:
+        # some converters only work from a path, spill small files to disk
+        if len(data) > settings.CONVERT_SPOOL_MAX_BYTES:
+            raise
+
+        logger.warning("Convert from stream failed, retry from a temporary file")
+        with tempfile.NamedTemporaryFile(suffix=file_suffix) as temp_file:
+            temp_file.write(data)
+            temp_file.flush()
+
+            return md.convert(temp_file.name).text_content
+
+
+def convert_document(data: bytes | str, file_suffix: Optional[str], mode: str):
+    if isinstance(data, str):
+        return data
+
+    if mode == MODE_VISION:
+        return convert_pdf_to_img_base64(data)
+
+    if mode == MODE_ADAPTIVE and file_suffix:
+        return convert_adaptive(data, file_suffix)
+
+    if isinstance(data, bytes) and file_suffix:
+        return convert_to_markdown(data, file_suffix)
+
+    raise TypeError("resume_data is not valid type")
+
+
+def get_executor() -> Optional[ProcessPoolExecutor]:
+    if settings.CONVERT_WORKERS <= 0:
+        return None
+
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            logger.info(f"Starting {settings.CONVERT_WORKERS} conversion workers")
+            # spawn, forking a process that already runs threads is unsafe
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.CONVERT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_get_markitdown,
+            )
+
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True, cancel_futures=True)
+            _executor = None
+
+
+def _discard_executor(executor: ProcessPoolExecutor):
+    """Drop a broken pool, the next get_executor starts a new one"""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            logger.warning("Conversion worker died, restarting the pool")
+            executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+async def convert_document_async(data: bytes | str, file_suffix: Optional[str], mode: str):
+    executor = get_executor()
+    if executor is None or isinstance(data, str):
+        return await run_in_threadpool(convert_document, data, file_suffix, mode)
+
+    loop = asyncio.get_running_loop()
+    # a crashed worker (OOM kill, segfault in a native parser) breaks the whole
+    # pool, retry once on a new one
+    for attempt in range(2):
+        try:
+            return await loop.run_in_executor(
+                executor, convert_document, data, file_suffix, mode
+            )
+        except BrokenProcessPool as e:
+            _discard_executor(executor)
+            if attempt:
+                raise GenerationError(f"Document conversion failed: {e}") from e
+            executor = get_executor()
@@ -0,0 +1,132 @@
+import re
+import json
+
+from typing import Any, Optional
+
+
+class JsonObjectTracker:
+    """
+    Follow streamed model output and tell when the first top-level JSON
+    object is closed, so generation can stop without waiting for trailing
+    tokens. Text before the first `{` (think blocks, code fences) is ignored.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.closed = False
+        self._in_string = False
+        self._escape = False
+        self._in_think = False
+        self._prefix = ""
+
+    def feed(self, text: str) -> bool:
+        for ch in text:
+            if self.closed:
+                break
+
+            if not self.started:
+                self._prefix = (self._prefix + ch)[-8:]
+                if self._prefix.endswith("<think>"):
+                    self._in_think = True
+                elif self._prefix.endswith("</think>"):
+                    self._in_think = False
+                if ch != "{" or self._in_think:
+                    continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"' and self.started:
+                self._in_string = True
+            elif ch == "{":
+                self.started = True
+                self.depth += 1
+            elif ch == "}" and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.closed = True
+
+        return self.closed
+
+
+_CLOSERS = {"{": "}", "[": "]"}
+_THINK_RE = re.compile(r"<think>.*?(</think>|$)", flags=re.DOTALL)
+
+
+def _closers(stack: list[str]) -> str:
+    return "".join(_CLOSERS[c] for c in reversed(stack))
+
+
+def repair_json(text: str) -> Optional[Any]:
+    """
+    Parse the first JSON object in model output, tolerating what LLMs get
+    wrong: think blocks, code fences, text around the object, trailing commas
+    and output truncated mid-object. Truncated objects keep every complete
+    member, the unfinished one is dropped. Returns None if nothing parses.
+    """
+    text = _THINK_RE.sub("", text)
+    start = text.find("{")
+    if start < 0:
+        return None
+    text = text[start:]
+
+    try:
+        obj, _ = json.JSONDecoder().raw_decode(text)
+        return obj
+    except ValueError:
+        pass
+
+    stack = []
+    # (end index, open containers) where the text can be cut and closed
+    cut_points = []
+    in_string = escape = False
+    end = len(text)
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+
+        if ch == '"':
+            in_string = True
+        elif ch in _CLOSERS:
+            stack.append(ch)
+            cut_points.append((i + 1, list(stack)))
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            cut_points.append((i + 1, list(stack)))
+            if not stack:
+                end = i + 1
+                break
+        elif ch == ",":
+            cut_points.append((i, list(stack)))
+
+    candidates = []
+    if not stack:
+        candidates.append(text[:end])
+    else:
+        tail = text + ('"' if in_string else "")
+        candidates.append(tail + _closers(stack))
+    candidates += [text[:idx] + _closers(s) for idx, s in reversed(cut_points)]
+
+    for candidate in candidates:
+        # trailing commas are invalid JSON but common in model output
+        candidate = re.sub(r",\s*([}\]])", r"\1", candidate)
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            continue
+
+    return None
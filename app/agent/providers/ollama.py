@@ -1,17 +1,114 @@
 import json
+import threading
 
+import httpx
 import logging
 import ollama
 
-from typing import Any, Dict, List, Optional
+from typing import AsyncIterator, List, Optional
 from fastapi.concurrency import run_in_threadpool
 
 from .exceptions import GenerationError
+from ...core import settings
 from .base import ExtractionProvider, EmbeddingProvider, remove_image_special
+from .json_utils import JsonObjectTracker, repair_json
+from ..budget import MIN_PART_TOKENS, estimate_tokens, fit_text
+from ..cache import embedding_cache
 
 
 logger = logging.getLogger(__name__)
 
+_clients: dict[Optional[str], ollama.AsyncClient] = {}
+
+# chunks read after the JSON object is closed, waiting for the final one with stats
+_STATS_GRACE_CHUNKS = 8
+
+
+def get_async_client(host: Optional[str] = None) -> ollama.AsyncClient:
+    """
+    One AsyncClient (and so one HTTP connection pool) per Ollama host, shared
+    by the generation and embedding providers.
+    """
+    if host not in _clients:
+        _clients[host] = ollama.AsyncClient(
+            host=host,
+            timeout=httpx.Timeout(settings.OLLAMA_TIMEOUT, connect=10),
+            limits=httpx.Limits(
+                max_connections=settings.OLLAMA_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OLLAMA_MAX_CONNECTIONS,
+            ),
+        )
+
+    return _clients[host]
+
+
+class GenerationStats:
+    """
+    Prefill/decode counters taken from the final response of each generation.
+
+    Ollama only evaluates the part of the prompt that is not already in the
+    KV cache, the estimated prompt size minus `prompt_eval_count` roughly is
+    the static prefix (system message, schema, JD) that was reused. The prompt
+    size comes from `estimate_tokens`, not the model tokenizer.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.cached_tokens_estimate = 0
+        self.prompt_eval_count = 0
+        self.prompt_eval_ms = 0.0
+        self.eval_count = 0
+        self.eval_ms = 0.0
+        self.load_ms = 0.0
+
+    def record(self, prompt_tokens: int, response) -> dict:
+        prompt_eval_count = response.prompt_eval_count or 0
+        call = {
+            "prompt_tokens_estimate": prompt_tokens,
+            "cached_tokens_estimate": max(prompt_tokens - prompt_eval_count, 0),
+            "prompt_eval_count": prompt_eval_count,
+            "prompt_eval_ms": (response.prompt_eval_duration or 0) / 1e6,
+            "eval_count": response.eval_count or 0,
+            "eval_ms": (response.eval_duration or 0) / 1e6,
+            "load_ms": (response.load_duration or 0) / 1e6,
+        }
+
+        with self._lock:
+            self.calls += 1
+            self.cached_tokens_estimate += call["cached_tokens_estimate"]
+            self.prompt_eval_count += call["prompt_eval_count"]
+            self.prompt_eval_ms += call["prompt_eval_ms"]
+            self.eval_count += call["eval_count"]
+            self.eval_ms += call["eval_ms"]
+            self.load_ms += call["load_ms"]
+
+        logger.info(f"Ollama generation: {call}")
+        return call
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "cached_tokens_estimate": self.cached_tokens_estimate,
+                "prompt_eval_count": self.prompt_eval_count,
+                "prompt_eval_ms": round(self.prompt_eval_ms, 1),
+                "eval_count": self.eval_count,
+                "eval_ms": round(self.eval_ms, 1),
+                "load_ms": round(self.load_ms, 1),
+            }
+
+
+generation_stats = GenerationStats()
+
+
+async def check_installed(client: ollama.AsyncClient, model_name: str):
+    installed_ollama_models = [
+        model_class.model for model_class in (await client.list()).models
+    ]
+    if model_name not in installed_ollama_models:
+        raise GenerationError("Model has not installed !!!")
+
 
 class OllamaExtractionProvider(ExtractionProvider):
     def __init__(self, model_name: str, use_vision: int, host: Optional[str] = None):
@@ -20,7 +117,7 @@ class OllamaExtractionProvider(ExtractionProvider):
 
         self.otps = {
             "temperature": 0,
-            "num_ctx": 12288,
+            "num_ctx": settings.OLLAMA_NUM_CTX,
             "num_predict": -1,
             "seed": 42,
             "top_k": 1,
@@ -28,75 +125,193 @@ class OllamaExtractionProvider(ExtractionProvider):
         }
         self.model = model_name
         logger.info(f"Using model {model_name}")
-        self._client = ollama.Client(host=host) if host else ollama.Client()
+        self._client = get_async_client(host)
 
-        installed_ollama_models = [
-            model_class.model for model_class in self._client.list().models
-        ]
-        if model_name not in installed_ollama_models:
-            raise GenerationError("Model has not installed !!!")
+    async def check_model(self):
+        await check_installed(self._client, self.model)
+
+    def _fit_document(self, text: str, prompt: str, sys_mess: str) -> str:
+        """
+        Clean the document text and cut it to what is left of the context
+        window after the prompts and the answer reserve.
+        """
+        if not settings.CONTEXT_OUTPUT_TOKENS:
+            return text
+
+        budget = (
+            self.otps["num_ctx"]
+            - settings.CONTEXT_OUTPUT_TOKENS
+            - estimate_tokens(sys_mess)
+            - estimate_tokens(prompt)
+        )
+        if budget < MIN_PART_TOKENS:
+            # fit_text takes 0 as no limit, still cut down to a minimal part
+            logger.warning(
+                f"Prompts leave {budget} tokens of num_ctx for the document, "
+                f"cutting it to {MIN_PART_TOKENS}"
+            )
+            budget = MIN_PART_TOKENS
+
+        return fit_text(text, budget)
 
-    def _preprocess_data(self, resume_data: bytes|str, prompt: str, file_suffix: str):
-        converted_data = self.convert_data(resume_data, file_suffix)
-        if not self.use_vision:
-            data_input_model = prompt + converted_data
+    def _preprocess_data(
+        self, converted_data: str | list[str] | dict, prompt: str, sys_mess: str = ""
+    ):
+        """
+        Return (prompt for the model, images or None, original document data).
+
+        The static prompt always comes before the document so consecutive
+        calls share a prefix in Ollama's prompt cache. Only the text sent to
+        the model is fitted to the context, the original data is returned as is.
+        """
+        # adaptive mode: markdown text plus images of the scanned pages
+        if isinstance(converted_data, dict):
+            images = converted_data["images"] or None
+            text = self._fit_document(converted_data["text"], prompt, sys_mess)
+            return prompt + text, images, converted_data["text"]
 
-        return data_input_model, converted_data
+        # vision mode: every page as image
+        if isinstance(converted_data, list):
+            return prompt, converted_data, converted_data
+
+        text = self._fit_document(converted_data, prompt, sys_mess)
+        return prompt + text, None, converted_data
 
     def _postprocess(self, model_res: str):
-        result = remove_image_special(model_res["response"].strip())
+        result = remove_image_special(model_res.strip())
 
         try:
             result = json.loads(result)
 
         except:
+            logger.warning("Model return wrong json format, try to repair it")
+            result = repair_json(result)
+
+        if not isinstance(result, dict):
             result = {}
             logger.error("Model return wrong json format !!!")
 
         return result
 
-    def _generate_sync(
-        self, resume_data: bytes|str, prompt: str, sys_mess: str, file_suffix: str
-    ) -> str:
+    def _generate_kwargs(
+        self, preprocessed_data: str, images, sys_mess: str, schema: Optional[dict]
+    ) -> dict:
+        if not images:
+            logger.info(sys_mess + "\n" + preprocessed_data)
+        else:
+            logger.info(f"Send {len(images)} page images to the model")
+
+        return {
+            "system": sys_mess,
+            "prompt": preprocessed_data,
+            "model": self.model,
+            "options": self.otps,
+            "keep_alive": settings.OLLAMA_KEEP_ALIVE,
+            "images": images,
+            # constrain decoding to the schema, no more invalid json
+            "format": schema if settings.OLLAMA_STRUCTURED_OUTPUT else None,
+            # "think": True,
+        }
+
+    async def _stream_tokens(self, kwargs: dict) -> AsyncIterator[str]:
         """
-        Generate a response from the model.
+        Yield response tokens until the JSON object in the response is closed,
+        then read a few more chunks for the final one carrying the timings.
+        Leaving the stream closes the request and Ollama stops generating.
         """
-        preprocessed_data, original_data = self._preprocess_data(resume_data, prompt, file_suffix)
+        prompt_tokens = estimate_tokens(kwargs["system"]) + estimate_tokens(kwargs["prompt"])
+        tracker = JsonObjectTracker()
+        closed = False
+        extra = 0
 
+        response = await self._client.generate(stream=True, **kwargs)
         try:
-            if not self.use_vision:
-                logger.info(sys_mess + "\n" + preprocessed_data)
-
-                response = self._client.generate(
-                    system=sys_mess,
-                    prompt=preprocessed_data,
-                    model=self.model,
-                    options=self.otps,
-                    # think=True,
-                )
-            else:
-                response = self._client.generate(
-                    system=sys_mess,
-                    prompt=prompt,
-                    model=self.model,
-                    options=self.otps,
-                    images=preprocessed_data,
-                )
+            async for chunk in response:
+                if chunk.done:
+                    if not closed:
+                        yield chunk.response
+                    generation_stats.record(prompt_tokens, chunk)
+                    break
+
+                if closed:
+                    extra += 1
+                    if extra >= _STATS_GRACE_CHUNKS:
+                        break
+                    continue
+
+                yield chunk.response
+                closed = tracker.feed(chunk.response)
+
+        finally:
+            # closes the http stream now rather than on garbage collection
+            await response.aclose()
+
+    async def stream(
+        self,
+        resume_data: bytes | str,
+        prompt: str,
+        sys_mess: str,
+        file_suffix: str,
+        schema: Optional[dict] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Yield response tokens as they arrive. Stops as soon as the JSON object
+        in the response is closed.
+        """
+        converted_data = await self.aconvert_data(resume_data, file_suffix)
+        preprocessed_data, images, _ = self._preprocess_data(
+            converted_data, prompt, sys_mess
+        )
 
-            # logger.info(response["response"].strip())
+        kwargs = self._generate_kwargs(preprocessed_data, images, sys_mess, schema)
+        try:
+            async for token in self._stream_tokens(kwargs):
+                yield token
 
-            return self._postprocess(response), original_data
+        except Exception as e:
+            raise GenerationError(f"Ollama - Error generating response: {e}") from e
+
+    async def _generate(
+        self, preprocessed_data: str, images, sys_mess: str, schema: Optional[dict]
+    ) -> str:
+        kwargs = self._generate_kwargs(preprocessed_data, images, sys_mess, schema)
+        try:
+            if not settings.OLLAMA_STREAM:
+                response = await self._client.generate(**kwargs)
+                generation_stats.record(
+                    estimate_tokens(kwargs["system"]) + estimate_tokens(kwargs["prompt"]),
+                    response,
+                )
+                return response.response
+
+            return "".join([token async for token in self._stream_tokens(kwargs)])
 
         except Exception as e:
             raise GenerationError(f"Ollama - Error generating response: {e}") from e
 
     async def __call__(
-        self, resume_data: bytes, prompt: str, sys_mess: str, file_suffix: str
-    ) -> str:
-        return await run_in_threadpool(
-            self._generate_sync, resume_data, prompt, sys_mess, file_suffix
+        self,
+        resume_data: bytes,
+        prompt: str,
+        sys_mess: str,
+        file_suffix: str,
+        schema: Optional[dict] = None,
+    ) -> tuple[dict, str]:
+        """
+        Generate a response from the model, constrained to `schema` (JSON
+        schema) when given.
+        """
+        # conversion runs on the process pool, generation is async http
+        converted_data = await self.aconvert_data(resume_data, file_suffix)
+        preprocessed_data, images, original_data = self._preprocess_data(
+            converted_data, prompt, sys_mess
         )
 
+        response = await self._generate(preprocessed_data, images, sys_mess, schema)
+        # logger.info(response)
+
+        return self._postprocess(response), original_data
+
 
 class OllamaEmbeddingProvider(EmbeddingProvider):
     def __init__(
@@ -116,41 +331,61 @@ class OllamaEmbeddingProvider(EmbeddingProvider):
         }
         self._model = model_name
         logger.info(f"Using model {model_name}")
-        self._client = ollama.Client(host=host) if host else ollama.Client()
+        self._client = get_async_client(host)
 
-        installed_ollama_models = [
-            model_class.model for model_class in self._client.list().models
+    async def check_model(self):
+        await check_installed(self._client, self._model)
+
+    def _cache_keys(self, input_data: list[str], task: str, query: bool) -> list[str]:
+        return [
+            embedding_cache.make_key(
+                self._model, settings.EMBEDDING_DIMENSIONS, task, query, data
+            )
+            for data in input_data
         ]
-        if self._model not in installed_ollama_models:
-            raise GenerationError("Model has not installed !!!")
 
-    def _embed_sync(self, input_data: list[str], task: str, query: bool) -> str:
-        preprocessed_data = []
+    async def _embed(self, input_data: list[str], task: str, query: bool) -> list[list[float]]:
+        keys = self._cache_keys(input_data, task, query)
+        # the disk tier is SQLite, keep it off the event loop
+        embeddings = await run_in_threadpool(
+            lambda: [embedding_cache.get(key) for key in keys]
+        )
+        missing = [i for i, emb in enumerate(embeddings) if emb is None]
+        if not missing:
+            return embeddings
 
+        preprocessed_data = []
         if query:
-            for data in input_data:
+            for i in missing:
                 # Qwen3 have instruct
-                preprocessed_data.append(f"Instruct: {task}\nQuery: {data}")
+                preprocessed_data.append(f"Instruct: {task}\nQuery: {input_data[i]}")
         else:
-            preprocessed_data = input_data
+            preprocessed_data = [input_data[i] for i in missing]
 
         logger.info(preprocessed_data)
         try:
-            response = self._client.embed(
+            response = await self._client.embed(
                 input=preprocessed_data,
                 model=self._model,
                 truncate=True,
-                dimensions=1024,
+                dimensions=settings.EMBEDDING_DIMENSIONS,
+                keep_alive=settings.OLLAMA_KEEP_ALIVE,
             )
 
-            return response
-
         except Exception as e:
             raise GenerationError(f"Ollama - Error generating response: {e}") from e
 
+        def store():
+            for i, emb in zip(missing, response.embeddings):
+                embeddings[i] = emb
+                embedding_cache.set(keys[i], emb)
+
+        await run_in_threadpool(store)
+
+        return embeddings
+
     async def __call__(self, input_data: str, task, query: bool = False) -> List[float]:
-        response = await run_in_threadpool(self._embed_sync, input_data, task, query)
-        return response.embeddings
+        return await self._embed(input_data, task, query)
 
 
 if __name__ == "__main__":
@@ -14,4 +14,24 @@ Guidelines:
 
 PROMPT = "Job Description:\n"
 
-TASK = "Embed the following job description to capture its semantic meaning for talent matching. Focus on required skills, responsibilities, experience level, and industry context."
\ No newline at end of file
+TASK = "Embed the following job description to capture its semantic meaning for talent matching. Focus on required skills, responsibilities, experience level, and industry context."
+
+
+# structured output schema for SYSTEM, passed to ollama `format=`
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "job_name": {"type": "string"},
+        "job_description": {"type": "string"},
+        "required_skills": {"type": "array", "items": {"type": "string"}},
+        "minimum_years_of_experience": {"type": "string"},
+        "extracted_keywords": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": [
+        "job_name",
+        "job_description",
+        "required_skills",
+        "minimum_years_of_experience",
+        "extracted_keywords",
+    ],
+}
@@ -79,4 +79,107 @@ Guidelines:
 
 PROMPT = "Resume:\n"
 
-TASK = "Given a web search query, retrieve relevant passages that answer the query"
\ No newline at end of file
+TASK = "Given a web search query, retrieve relevant passages that answer the query"
+
+
+def _strings(*names):
+    return {name: {"type": "string"} for name in names}
+
+
+def _string_array():
+    return {"type": "array", "items": {"type": "string"}}
+
+
+# structured output schema for SYSTEM, passed to ollama `format=`
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "personal_info": {
+            "type": "object",
+            "properties": {
+                **_strings(
+                    "full_name",
+                    "email",
+                    "year_of_birth",
+                    "gender",
+                    "marital_status",
+                    "address",
+                    "nationality",
+                    "desired_position",
+                    "year_of_experience",
+                    "phone_number",
+                    "current_location",
+                    "available_date",
+                    "expected_salary_min",
+                    "expected_salary_max",
+                    "cover_letter_url",
+                    "github_url",
+                    "linkedin_url",
+                    "summary_personal_info",
+                ),
+                "languages": _string_array(),
+            },
+            "required": ["full_name", "year_of_experience", "desired_position"],
+        },
+        "education": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": _strings(
+                    "school_name", "major", "degree", "duration", "summary_education"
+                ),
+                "required": ["school_name", "major", "degree", "duration"],
+            },
+        },
+        "certificates": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": _strings("certificate_name", "issuer", "issued_date", "file_url"),
+                "required": ["certificate_name"],
+            },
+        },
+        "skills": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": _strings("skill_name", "proficiency", "summary_skill"),
+                "required": ["skill_name"],
+            },
+        },
+        "experience": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": _strings(
+                    "company", "position", "duration", "job_description", "summary_experience"
+                ),
+            },
+        },
+        "project": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": _strings(
+                    "proj_name",
+                    "proj_company",
+                    "proj_position",
+                    "duration",
+                    "proj_tech",
+                    "proj_description",
+                ),
+                "required": ["proj_name", "duration"],
+            },
+        },
+        "extracted_keywords": _string_array(),
+    },
+    "required": [
+        "personal_info",
+        "education",
+        "certificates",
+        "skills",
+        "experience",
+        "project",
+        "extracted_keywords",
+    ],
+}
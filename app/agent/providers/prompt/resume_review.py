@@ -16,7 +16,9 @@ Output format (strictly follow this):
 }
 """
 
-PROMPT_REVIEW = """
+# the JD part is the same for every candidate of a JD, keep it before the
+# resume so Ollama reuses it from the prompt cache
+PROMPT_REVIEW_JD = """
 Job Description:
 ```md
 {raw_job_description}
@@ -26,7 +28,9 @@ Extracted Job Keywords:
 ```md
 {extracted_job_keywords}
 ```
+"""
 
+PROMPT_REVIEW_CV = """
 Original Resume:
 ```md
 {raw_resume}
@@ -37,3 +41,25 @@ Extracted Resume Keywords:
 {extracted_resume_keywords}
 ```
 """
+
+PROMPT_REVIEW = PROMPT_REVIEW_JD + PROMPT_REVIEW_CV
+
+
+# structured output schema for SYSTEM_REVIEW, passed to ollama `format=`
+SCHEMA_REVIEW = {
+    "type": "object",
+    "properties": {
+        "match_score": {"type": "integer", "minimum": 0, "maximum": 100},
+        "strong_matches": {"type": "array", "items": {"type": "string"}},
+        "partial_matches": {"type": "array", "items": {"type": "string"}},
+        "missing_keywords": {"type": "array", "items": {"type": "string"}},
+        "summary": {"type": "string"},
+    },
+    "required": [
+        "match_score",
+        "strong_matches",
+        "partial_matches",
+        "missing_keywords",
+        "summary",
+    ],
+}
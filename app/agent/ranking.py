@@ -0,0 +1,136 @@
+import re
+import logging
+
+import numpy as np
+
+from typing import Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+def reciprocal_rank_fusion(result_lists: list[list[dict]], k: int = 60) -> list[dict]:
+    """
+    Fuse ES hit lists with RRF: score = sum(1 / (k + rank)) over the lists a
+    hit appears in. Hits are matched on `_id`, the fused score is stored in
+    `_score`.
+    """
+    scores = {}
+    hits = {}
+    for result in result_lists:
+        for rank, hit in enumerate(result, start=1):
+            scores[hit["_id"]] = scores.get(hit["_id"], 0) + 1 / (k + rank)
+            hits.setdefault(hit["_id"], hit)
+
+    fused = [{**hits[_id], "_score": score} for _id, score in scores.items()]
+    return sorted(fused, key=lambda hit: hit["_score"], reverse=True)
+
+
+def weighted_fusion(result_lists: list[list[dict]], weights: list[float]) -> list[dict]:
+    """
+    Fuse ES hit lists with a weighted sum of their min-max normalised scores.
+    """
+    scores = {}
+    hits = {}
+    for result, weight in zip(result_lists, weights):
+        if not result:
+            continue
+
+        raw = [hit["_score"] or 0 for hit in result]
+        low, high = min(raw), max(raw)
+        for hit, score in zip(result, raw):
+            norm = (score - low) / (high - low) if high > low else 1.0
+            scores[hit["_id"]] = scores.get(hit["_id"], 0) + weight * norm
+            hits.setdefault(hit["_id"], hit)
+
+    fused = [{**hits[_id], "_score": score} for _id, score in scores.items()]
+    return sorted(fused, key=lambda hit: hit["_score"], reverse=True)
+
+
+def _keyword_set(keywords) -> set[str]:
+    if isinstance(keywords, str):
+        keywords = keywords.split(",")
+
+    return {k.strip().lower() for k in keywords or [] if k and k.strip()}
+
+
+def keyword_overlap(jd_keywords, cv_keywords) -> float:
+    """
+    Share of JD keywords covered by the CV keywords, exact term match or
+    contained in a CV keyword ("react" matches "react native").
+    """
+    jd_set = _keyword_set(jd_keywords)
+    if not jd_set:
+        return 0.0
+
+    cv_set = _keyword_set(cv_keywords)
+    cv_text = " | ".join(cv_set)
+    found = sum(
+        1
+        for k in jd_set
+        if k in cv_set or re.search(rf"(?<!\w){re.escape(k)}(?!\w)", cv_text)
+    )
+
+    return found / len(jd_set)
+
+
+def cosine_similarity(query: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    query = query / (np.linalg.norm(query) or 1.0)
+    norms = np.linalg.norm(vectors, axis=1)
+    norms[norms == 0] = 1.0
+
+    return (vectors @ query) / norms
+
+
+def pre_rank(
+    cv_list: list[dict],
+    jd_vector: list[float],
+    jd_keywords,
+    top_n: int,
+    min_years: Optional[float] = None,
+    vector_weight: float = 0.5,
+    keyword_weight: float = 0.5,
+    experience_tolerance: float = 0,
+) -> list[dict]:
+    """
+    Cheap scoring of retrieved CVs before the LLM review, keep the best top_n.
+
+    * CVs with a known year_of_experience below min_years - tolerance are
+      dropped, CVs without it are kept
+    * score = vector_weight * cosine(JD, CV) + keyword_weight * keyword overlap
+    * `embedding_vector` is removed from the returned hits
+    """
+    candidates = []
+    for hit in cv_list:
+        yoe = hit["_source"].get("year_of_experience")
+        if min_years and isinstance(yoe, (int, float)) and yoe < min_years - experience_tolerance:
+            continue
+        candidates.append(hit)
+
+    if not candidates:
+        return []
+
+    # CVs missing a stored vector get a similarity of 0
+    dims = len(jd_vector)
+    vectors = np.zeros((len(candidates), dims), dtype=np.float32)
+    for i, hit in enumerate(candidates):
+        vector = hit["_source"].get("embedding_vector")
+        if vector and len(vector) == dims:
+            vectors[i] = vector
+    vector_scores = cosine_similarity(np.asarray(jd_vector, dtype=np.float32), vectors)
+
+    ranked = []
+    for hit, vector_score in zip(candidates, vector_scores):
+        keyword_score = keyword_overlap(jd_keywords, hit["_source"].get("keywords"))
+        score = vector_weight * float(vector_score) + keyword_weight * keyword_score
+
+        source = {k: v for k, v in hit["_source"].items() if k != "embedding_vector"}
+        ranked.append({**hit, "_source": source, "pre_rank_score": score})
+
+    ranked = sorted(ranked, key=lambda hit: hit["pre_rank_score"], reverse=True)
+    logger.info(
+        f"Pre-rank kept {min(top_n, len(ranked))} of {len(cv_list)} CVs "
+        f"({len(cv_list) - len(candidates)} below experience)"
+    )
+
+    return ranked[:top_n]
@@ -1,71 +1,204 @@
+import asyncio
 import logging
 import traceback
 import re
 import os
 from datetime import datetime, timezone, timedelta
-from elasticsearch import Elasticsearch, AsyncElasticsearch
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.helpers import async_streaming_bulk
 
-from .manager import GenerationManager, EmbeddingManager
+from .providers import ExtractionProvider, EmbeddingProvider
 from .utils import convert_resume_format
-from .providers.prompt.resume_prompt import PROMPT, SYSTEM, TASK
+from ..core import settings
+from .providers.prompt.resume_prompt import PROMPT, SCHEMA, SYSTEM, TASK
 
 logger = logging.getLogger(__name__)
 
 
 class ResumeService:
-    def __init__(self):
-        self.generation_manager = GenerationManager()
-        self.embedding_manager = EmbeddingManager()
+    def __init__(
+        self,
+        model_gen: ExtractionProvider,
+        model_emb: EmbeddingProvider,
+        es_client: AsyncElasticsearch,
+    ):
+        self.model_gen = model_gen
+        self.model_emb = model_emb
 
-        self.es_client = AsyncElasticsearch(hosts=[os.environ["ES_HOST"]])
+        self.es_client = es_client
         self.index_name = os.environ["ES_CV_INDEX"]
         logger.info(f"Index name: {self.index_name}")
 
         self.timezone = timezone(timedelta(hours=8))
 
-    async def _store_resume(self, gen_res, emb_res, file_name, cv_id, resume_text):
-        year_of_experience = gen_res["personal_info"]["year_of_experience"]
-        if year_of_experience:
-            match = re.search(r"\d+", str(year_of_experience))
-            if match:
-                year_of_experience = float(match.group(0))
+    def _build_doc(
+        self, gen_res, gen_res_format, emb_res, file_name, cv_id, resume_text
+    ):
+        personal_info = gen_res.get("personal_info") or {}
+        # the field is mapped as float, "Fresher" or "N/A" would reject the document
+        match = re.search(r"\d+", str(personal_info.get("year_of_experience")))
+        year_of_experience = float(match.group(0)) if match else None
 
+        now = datetime.now(self.timezone).isoformat()
         doc = {
             "id": cv_id,
             "cv_url": file_name,
             "content": resume_text,
-            "keywords": ", ".join(gen_res["extracted_keywords"]),
+            "keywords": ", ".join(gen_res.get("extracted_keywords") or []),
             "year_of_experience": year_of_experience,
             "embedding_vector": emb_res,
-            "full_name": gen_res["personal_info"]["full_name"],
-            "desired_position": gen_res["personal_info"].get("desired_position"),
-            "created_at": datetime.now(self.timezone).isoformat(),
+            "full_name": personal_info.get("full_name"),
+            "desired_position": personal_info.get("desired_position"),
+            "created_at": now,
+            "updated_at": now,
+            # raw extraction, `python -m app.reformat` rebuilds info_extract from it
+            "info_extract": gen_res_format,
+            "info_extract_raw": gen_res,
         }
 
+        return doc
+
+    async def _store_resume(
+        self, gen_res, gen_res_format, emb_res, file_name, cv_id, resume_text
+    ):
+        doc = self._build_doc(
+            gen_res, gen_res_format, emb_res, file_name, cv_id, resume_text
+        )
+
         resp = await self.es_client.index(index=self.index_name, document=doc)
         logger.info(resp)
-        await self.es_client.close()
 
-    async def extract_and_store(self, contents, prompt, file_name, cv_id=None):
-        model_gen = await self.generation_manager.init_model()
-        model_emb = await self.embedding_manager.init_model()
+    async def _store_resume_bulk(self, docs: list[dict]) -> list[str | None]:
+        """
+        Index documents with the bulk helper, return an error message (or None)
+        for each document in order.
+        """
+        actions = [{"_index": self.index_name, "_source": doc} for doc in docs]
+
+        errors = []
+        async for ok, info in async_streaming_bulk(
+            self.es_client,
+            actions,
+            chunk_size=settings.BATCH_BULK_CHUNK_SIZE,
+            raise_on_error=False,
+            raise_on_exception=False,
+        ):
+            errors.append(None if ok else str(info))
 
+        return errors
+
+    async def _extract(self, contents, prompt, file_name, suffix=None):
         if prompt is None:
             prompt = PROMPT
 
-        suffix = "." + file_name.split(".")[-1]
-        gen_res, resume_text = await model_gen(contents, prompt, SYSTEM, suffix)
+        if suffix is None:
+            suffix = "." + file_name.split(".")[-1]
+        gen_res, resume_text = await self.model_gen(
+            contents, prompt, SYSTEM, suffix, schema=SCHEMA
+        )
         logger.info(gen_res)
+
+        return gen_res, resume_text
+
+    async def extract_and_store(
+        self, contents, prompt, file_name, cv_id=None, suffix=None
+    ):
+        gen_res, resume_text = await self._extract(contents, prompt, file_name, suffix)
         gen_res_format = convert_resume_format(gen_res)
 
-        emb_res = await model_emb([resume_text], TASK)
+        emb_res = await self.model_emb([resume_text], TASK)
 
         if cv_id:
             logger.info("Saving resume ....")
             try:
-                await self._store_resume(gen_res, emb_res[0], file_name, cv_id, resume_text)
+                await self._store_resume(
+                    gen_res, gen_res_format, emb_res[0], file_name, cv_id, resume_text
+                )
             except:
                 logger.info("Save data failed!!!!!!")
                 logger.error(traceback.format_exc())
 
         return gen_res, gen_res_format
+
+    async def extract_and_store_batch(self, items: list[dict], prompt=None):
+        """
+        Extract many resumes at once.
+
+        Each item is a dict with `contents`, `file_name` and optional `cv_id`,
+        `suffix`. Extraction runs concurrently, all resume texts are embedded
+        in a single call and the documents are indexed with one bulk request.
+        Returns one result dict per item, in order, holding either the
+        extraction or an `error` message.
+        """
+        semaphore = asyncio.Semaphore(settings.BATCH_CONCURRENCY)
+
+        async def extract_one(item):
+            async with semaphore:
+                return await self._extract(
+                    item["contents"], prompt, item["file_name"], item.get("suffix")
+                )
+
+        extracted = await asyncio.gather(
+            *[extract_one(item) for item in items], return_exceptions=True
+        )
+
+        results = []
+        ok_idx = []
+        for idx, (item, res) in enumerate(zip(items, extracted)):
+            result = {"filename": item["file_name"], "cv_id": item.get("cv_id")}
+            if isinstance(res, BaseException):
+                logger.error(f"Extract {item['file_name']} failed: {res}")
+                result["error"] = str(res)
+            else:
+                gen_res, _ = res
+                try:
+                    result["info_extract"] = convert_resume_format(gen_res)
+                    result["info_extract_raw"] = gen_res
+                    ok_idx.append(idx)
+                except Exception as e:
+                    logger.error(traceback.format_exc())
+                    result["error"] = f"Convert format failed: {e}"
+            results.append(result)
+
+        if not ok_idx:
+            return results
+
+        emb_res = await self.model_emb([extracted[i][1] for i in ok_idx], TASK)
+
+        docs = []
+        doc_idx = []
+        for i, emb in zip(ok_idx, emb_res):
+            cv_id = items[i].get("cv_id")
+            if not cv_id:
+                continue
+
+            gen_res, resume_text = extracted[i]
+            try:
+                docs.append(
+                    self._build_doc(
+                        gen_res,
+                        results[i]["info_extract"],
+                        emb,
+                        items[i]["file_name"],
+                        cv_id,
+                        resume_text,
+                    )
+                )
+                doc_idx.append(i)
+            except Exception as e:
+                logger.error(traceback.format_exc())
+                results[i]["error"] = f"Save data failed: {e}"
+
+        if docs:
+            logger.info(f"Saving {len(docs)} resumes ....")
+            try:
+                errors = await self._store_resume_bulk(docs)
+            except Exception as e:
+                logger.error(traceback.format_exc())
+                errors = [str(e)] * len(docs)
+
+            for i, error in zip(doc_idx, errors):
+                if error:
+                    results[i]["error"] = f"Save data failed: {error}"
+
+        return results
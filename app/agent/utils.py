@@ -1,7 +1,103 @@
-import json
 import re
-import os
 import datetime
+import logging
+import traceback
+
+from functools import lru_cache
+from typing import Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+_MONTHS = {
+    "jan": "01",
+    "feb": "02",
+    "mar": "03",
+    "apr": "04",
+    "may": "05",
+    "jun": "06",
+    "jul": "07",
+    "aug": "08",
+    "sep": "09",
+    "oct": "10",
+    "nov": "11",
+    "dec": "12",
+}
+
+# months and days are range checked, "2018-19" is a year range, not month 19
+_M = r"(?:0?[1-9]|1[0-2])"
+_D = r"(?:0?[1-9]|[12]\d|3[01])"
+# one alternative per date format, the outer group name picks the formatter
+_DATE_PATTERN = (
+    r"(?P<now>now|present|current|today|至今|现在|目前|hiện tại|hiện nay|nay)"
+    rf"|(?P<ymd>(?P<ymd_y>\d{{4}})[./\- ](?P<ymd_m>{_M})[./\- ](?P<ymd_d>{_D}))"
+    rf"|(?P<ym>(?P<ym_y>\d{{4}})[./\- ](?P<ym_m>{_M}))"
+    rf"|(?P<my>(?P<my_m>{_M})[./](?P<my_y>\d{{4}}))"
+    rf"|(?P<cn>(?P<cn_y>\d{{4}})\s*年\s*(?:(?P<cn_m>{_M})\s*月\s*(?:(?P<cn_d>{_D})\s*日)?)?)"
+    r"|(?P<mon>(?P<mon_m>[a-z]+)\.?,?\s+(?P<mon_y>\d{4}))"
+    r"|(?P<y>\d{4})"
+)
+_DATE_RE = re.compile(_DATE_PATTERN, re.IGNORECASE)
+# the same alternatives without names, twice: start, optional separator, end
+_DATE_ANY = re.sub(r"\(\?P<\w+>", "(?:", _DATE_PATTERN)
+_DURATION_RE = re.compile(
+    rf"\s*(?P<start>{_DATE_ANY})\s*(?:[-–—~～]+|至|到|to|until|till)?\s*(?P<end>{_DATE_ANY})?\s*",
+    re.IGNORECASE,
+)
+_DASHES_RE = re.compile(r"[–—~]+|-{2,}")
+
+
+def _ymd(year: str, month: Optional[str] = None, day: Optional[str] = None) -> str:
+    parts = [year]
+    if month:
+        parts.append(month.zfill(2))
+        if day:
+            parts.append(day.zfill(2))
+
+    return "-".join(parts)
+
+
+_DATE_FORMATTERS = {
+    "now": lambda m: "Now",
+    "ymd": lambda m: _ymd(m["ymd_y"], m["ymd_m"], m["ymd_d"]),
+    "ym": lambda m: _ymd(m["ym_y"], m["ym_m"]),
+    "my": lambda m: _ymd(m["my_y"], m["my_m"]),
+    "cn": lambda m: _ymd(m["cn_y"], m["cn_m"], m["cn_d"]),
+    # unknown month names (Summer 2020) keep the year only
+    "mon": lambda m: _ymd(m["mon_y"], _MONTHS.get(m["mon_m"][:3].lower())),
+    "y": lambda m: m["y"],
+}
+
+
+def _normalize_date(part: Optional[str]) -> Optional[str]:
+    if part is None:
+        return None
+
+    part = part.strip()
+    if not part:
+        return None
+
+    match = _DATE_RE.fullmatch(part)
+    if match:
+        return _DATE_FORMATTERS[match.lastgroup](match)
+
+    return part  # fallback
+
+
+@lru_cache(maxsize=8192)
+def _convert_duration(duration: str) -> tuple[Optional[str], Optional[str]]:
+    match = _DURATION_RE.fullmatch(duration)
+    if match:
+        return _normalize_date(match["start"]), _normalize_date(match["end"])
+
+    # free text: split on the first dash and keep what can not be parsed
+    duration = _DASHES_RE.sub("-", duration).strip()
+    if "-" not in duration:
+        return duration, None
+
+    start, end = duration.split("-", 1)
+    return _normalize_date(start), _normalize_date(end)
 
 
 def convert_duration_to_dates(duration: str):
@@ -9,90 +105,15 @@ def convert_duration_to_dates(duration: str):
     Convert duration string to startDate, endDate
     Rules:
         - yyyy -> yyyy
-        - yyyy.mm -> yyyy-mm
-        - yyyy.mm.dd -> yyyy-mm-dd
-        - 'now' or '至今' -> now
+        - yyyy.mm, mm/yyyy, Feb 2022, yyyy年m月 -> yyyy-mm
+        - yyyy.mm.dd, yyyy年m月d日 -> yyyy-mm-dd
+        - 'now', 'present' or '至今' -> Now
 
     """
     if not duration:
         return None, None
 
-    duration = (
-        duration.replace("—", "-")
-        .replace("–", "-")
-        .replace("--", "-")
-        .replace("——", "-")
-        .replace("––", "-")
-        .replace("~", "-")
-        .strip()
-    )
-    if "-" not in duration:
-        return duration, None
-    start, end = [p.strip() for p in duration.split("-", 1)]
-    # start = start.replace(".", "-")
-
-    month_map = {
-        "jan": "01",
-        "feb": "02",
-        "mar": "03",
-        "apr": "04",
-        "may": "05",
-        "jun": "06",
-        "jul": "07",
-        "july": "07",
-        "aug": "08",
-        "sep": "09",
-        "sept": "09",
-        "oct": "10",
-        "nov": "11",
-        "dec": "12",
-    }
-
-    def normalize(part: str):
-        p = part.strip().lower()
-        if not p:
-            return None
-
-        # now / 至今
-        if p in ["now", "Now", "至今", "现在"]:
-            return "Now"
-
-        # yyyy
-        if re.match(r"^\d{4}$", p):
-            return p
-
-        # yyyy.mm or yyyy-mm or yyyy.mm or yyyy/mm
-        if re.match(r"^\d{4}[.-/ ]\d{1,2}$", p):
-            parts = list(filter(None, re.split(r"[.\-/ ]", p)))
-            if len(parts) == 2:
-                year, month = parts
-            return f"{year}-{month.zfill(2)}"
-
-        # yyyy.mm.dd or yyyy-mm-dd or yyyy/mm/dd or yyyy mm dd
-        if re.match(r"^\d{4}[.-/ ]\d{1,2}[.-/ ]\d{1,2}$", p):
-            year, month, day = re.split(r"[.-/ ]", p)
-            return f"{year}-{month.zfill(2)}-{day.zfill(2)}"
-
-        # Month Year ( ex: Feb 2022, July 2021)
-        match = re.match(r"([A-Za-z]+)\s+(\d{4})", p)
-        if match:
-            mon, year = match.groups()
-            mon = month_map.get(mon[:3].lower(), None)
-            return f"{year}-{mon}" if mon else year
-
-        # Chinese format: YYYY年M月 or YYYY年M月D日
-        match = re.match(r"(\d{4})年(\d{1,2})月(\d{1,2})?日?", part)
-        if match:
-            year, month, day = match.groups()
-            if day:
-                return f"{year}-{month.zfill(2)}-{day.zfill(2)}"
-            return f"{year}-{month.zfill(2)}"
-
-        return part  # fallback
-
-    startDate = normalize(start)
-    endDate = normalize(end)
-    return startDate, endDate
+    return _convert_duration(str(duration))
 
 
 def parse_years_of_experience(value: str):
@@ -147,7 +168,7 @@ def get_age(info: dict) -> int | None:
 
 def convert_resume_format(info):
     # ==== Personal Info ====
-    p = info["personal_info"]
+    p = info.get("personal_info") or {}
     personalInfo = {
         "fullName": p.get("full_name", ""),
         "phoneNumber": p.get("phone_number", ""),
@@ -196,7 +217,7 @@ def convert_resume_format(info):
 
     # ==== Skills ====
     skills = []
-    for s in info["skills"]:
+    for s in info.get("skills") or []:
         skills.append(
             {
                 "name": s.get("skill_name", ""),
@@ -262,23 +283,28 @@ def convert_jd_format():
     return
 
 
-if __name__ == "__main__":
-    input_folder = "/home/yaiba/Downloads/Telegram Desktop/results"
-    output_folder = "output_jsons"
-    os.makedirs(output_folder, exist_ok=True)
+def convert_top_cv_format(top_cv: list[dict]) -> list[dict]:
+    top_cv_shorten = []
+    for v in top_cv:
+        try:
+            source = v["_source"]
+            filtered_dict = {}
 
-    for file_name in os.listdir(input_folder):
-        if file_name.endswith(".json"):
-            input_path = os.path.join(input_folder, file_name)
-            output_path = os.path.join(output_folder, file_name)
+            filtered_dict["cv_id"] = source["id"]
+            filtered_dict["cv_url"] = source["cv_url"]
+            filtered_dict["content"] = source["content"]
+            filtered_dict["year_of_experience"] = source.get("year_of_experience")
+            filtered_dict["full_name"] = source["full_name"]
+            filtered_dict["match_score"] = v["match_score"]
+            filtered_dict["strong_matches"] = v["strong_matches"]
+            filtered_dict["partial_matches"] = v["partial_matches"]
+            filtered_dict["missing_keywords"] = v["missing_keywords"]
+            filtered_dict["review"] = v["summary"]
 
-            with open(input_path, "r", encoding="utf-8") as f:
-                raw_json = json.load(f)
+            top_cv_shorten.append(filtered_dict)
 
-            new_json = convert_resume_format(raw_json)
-            # print(new_json)
+        except:
+            logger.error(traceback.format_exc())
 
-            with open(output_path, "w", encoding="utf-8") as f:
-                json.dump(new_json, f, ensure_ascii=False, indent=2)
+    return top_cv_shorten
 
-            # print(f"Converted: {file_name} -> {output_path}")
@@ -1,4 +1,8 @@
-from fastapi import APIRouter, status, Depends
+from fastapi import APIRouter, status
+
+from ..core import es_client
+from ..agent.cache import review_cache, embedding_cache, conversion_cache
+from ..agent.providers.ollama import generation_stats
 
 
 health_check = APIRouter()
@@ -12,3 +16,31 @@ async def check():
     res = "Fine"
 
     return {"message": "pong", "result": res}
+
+
+@health_check.get("/healthcheck/elasticsearch", tags=["Health check"], status_code=status.HTTP_200_OK)
+async def check_elasticsearch():
+    """
+    Elasticsearch connection pool usage
+    """
+    return es_client.pool_stats()
+
+
+@health_check.get("/healthcheck/cache", tags=["Health check"], status_code=status.HTTP_200_OK)
+async def check_cache():
+    """
+    Cache hit/miss counters
+    """
+    return {
+        "review": review_cache.stats(),
+        "embedding": embedding_cache.stats(),
+        "conversion": conversion_cache.stats(),
+    }
+
+
+@health_check.get("/healthcheck/generation", tags=["Health check"], status_code=status.HTTP_200_OK)
+async def check_generation():
+    """
+    Ollama prefill/decode timings and estimated prompt cache reuse
+    """
+    return generation_stats.snapshot()
@@ -1,5 +1,4 @@
 import logging
-import requests
 import traceback
 
 from fastapi import APIRouter, UploadFile, HTTPException, Request, status, Form, File
@@ -7,6 +6,7 @@ from fastapi.responses import JSONResponse
 from typing import Optional
 
 from ..agent import JDService
+from ..agent.utils import convert_top_cv_format
 
 
 jd_matcher_router = APIRouter()
@@ -45,34 +45,16 @@ async def extract(
         prompt = prompt.decode("utf-8")
 
     try:
-        jd_service = JDService()
+        jd_service = JDService(
+            request.app.state.model_gen,
+            request.app.state.model_emb,
+            request.app.state.es_client,
+        )
         gen_res, top_cv = await jd_service.extract_match_review(
             contents, prompt, file_name, jd_id
         )
 
-        top_cv_shorten = []
-        for v in top_cv:
-            try:
-                source = v["_source"]
-                filtered_dict = {}
-
-                filtered_dict["cv_id"] = source["id"]
-                filtered_dict["cv_url"] = source["cv_url"]
-                filtered_dict["content"] = source["content"]
-                filtered_dict["year_of_experience"] = source.get(
-                    "year_of_experience"
-                )
-                filtered_dict["full_name"] = source["full_name"]
-                filtered_dict["match_score"] = v["match_score"]
-                filtered_dict["strong_matches"] = v["strong_matches"]
-                filtered_dict["partial_matches"] = v["partial_matches"]
-                filtered_dict["missing_keywords"] = v["missing_keywords"]
-                filtered_dict["review"] = v["summary"]
-
-                top_cv_shorten.append(filtered_dict)
-
-            except:
-                logger.error(traceback.format_exc())
+        top_cv_shorten = convert_top_cv_format(top_cv)
 
         return JSONResponse(
             content={
@@ -4,14 +4,16 @@ import traceback
 # from PIL import Image
 # from io import BytesIO
 # import base64
+import asyncio
 import json
-import requests
+import os
 
 from fastapi import APIRouter, UploadFile, HTTPException, Request, status, Form, File
 from fastapi.responses import JSONResponse
-from typing import Optional
+from typing import List, Optional
 
 from ..agent import ResumeService
+from ..core import downloader, DownloadError, SUPPORTED_SUFFIXES, settings
 
 
 resume_extract_router = APIRouter()
@@ -60,12 +62,17 @@ async def extract(
     if cv_file:
         contents = await cv_file.read()
         file_name = cv_file.filename
+        suffix = os.path.splitext(file_name)[1].lower()
 
     elif cv_url:
-        contents = requests.get(cv_url, timeout=30)
-        contents.raise_for_status()
-        contents = contents.content
+        try:
+            downloaded = await downloader.fetch(cv_url)
+        except DownloadError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+        contents = downloaded.content
         file_name = cv_url
+        suffix = downloaded.suffix
 
     else:
         raise HTTPException(
@@ -73,7 +80,7 @@ async def extract(
             detail="File is not provided",
         )
 
-    if not contents or not file_name.endswith((".pdf", ".docx", ".txt")):
+    if not contents or suffix not in SUPPORTED_SUFFIXES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid file. Please upload a valid file.",
@@ -88,9 +95,13 @@ async def extract(
         prompt = prompt.decode("utf-8")
 
     try:
-        resume_service = ResumeService()
+        resume_service = ResumeService(
+            request.app.state.model_gen,
+            request.app.state.model_emb,
+            request.app.state.es_client,
+        )
         gen_res, gen_res_format = await resume_service.extract_and_store(
-            contents, prompt, file_name, cv_id
+            contents, prompt, file_name, cv_id, suffix
         )
 
         return JSONResponse(
@@ -104,3 +115,109 @@ async def extract(
     except Exception as e:
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _load_batch_item(cv_url: Optional[str], cv_file: Optional[UploadFile]):
+    if cv_file:
+        contents = await cv_file.read()
+        file_name = cv_file.filename
+        suffix = os.path.splitext(file_name)[1].lower()
+    else:
+        downloaded = await downloader.fetch(cv_url)
+        contents = downloaded.content
+        file_name = cv_url
+        suffix = downloaded.suffix
+
+    if not contents or suffix not in SUPPORTED_SUFFIXES:
+        raise DownloadError("Invalid file. Please upload a valid file.")
+
+    return {"contents": contents, "file_name": file_name, "suffix": suffix}
+
+
+@resume_extract_router.post("/extract/batch")
+async def extract_batch(
+    request: Request,
+    cv_files: Optional[List[UploadFile]] = File(None),
+    cv_ids: Optional[List[str]] = Form(None),
+    prompt_file: Optional[UploadFile] = None,
+):
+    """
+    Extract many resumes in one call.
+
+    Accepts either multipart `cv_files` (with `cv_ids` in the same order) or
+    a JSON body `{"items": [{"cv_url": ..., "cv_id": ...}, ...]}`. Returns one
+    result per item, in order; failed items carry an `error` message.
+    """
+    content_type = request.headers.get("content-type")
+    if content_type and content_type.startswith("application/json"):
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        items = body.get("items", []) if isinstance(body, dict) else None
+        if not isinstance(items, list) or not all(isinstance(i, dict) for i in items):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail='Body must be {"items": [{"cv_url": ..., "cv_id": ...}, ...]}',
+            )
+        sources = [(item.get("cv_url"), None, item.get("cv_id")) for item in items]
+    else:
+        cv_files = cv_files or []
+        cv_ids = cv_ids or []
+        sources = [
+            (None, f, cv_ids[i] if i < len(cv_ids) else None)
+            for i, f in enumerate(cv_files)
+        ]
+
+    if not sources:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="File is not provided",
+        )
+    if len(sources) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many files, maximum is {settings.BATCH_MAX_ITEMS}",
+        )
+
+    logger.info(f"Batch of {len(sources)} resumes")
+
+    prompt = None
+    if prompt_file:
+        logger.info("Receive prompt from user")
+        prompt = await prompt_file.read()
+        prompt = prompt.decode("utf-8")
+
+    loaded = await asyncio.gather(
+        *[_load_batch_item(url, f) for url, f, _ in sources], return_exceptions=True
+    )
+
+    results = [None] * len(sources)
+    items = []
+    items_idx = []
+    for idx, ((cv_url, cv_file, cv_id), item) in enumerate(zip(sources, loaded)):
+        if isinstance(item, BaseException):
+            file_name = cv_url or (cv_file.filename if cv_file else None)
+            results[idx] = {"filename": file_name, "cv_id": cv_id, "error": str(item)}
+            continue
+
+        item["cv_id"] = cv_id
+        items.append(item)
+        items_idx.append(idx)
+
+    try:
+        resume_service = ResumeService(
+            request.app.state.model_gen,
+            request.app.state.model_emb,
+            request.app.state.es_client,
+        )
+        extracted = await resume_service.extract_and_store_batch(items, prompt)
+
+    except Exception as e:
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=str(e))
+
+    for idx, res in zip(items_idx, extracted):
+        results[idx] = res
+
+    return JSONResponse(content={"results": results})
@@ -1,23 +1,30 @@
+import os
+
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 
-from .core import setup_logging
+from .core import setup_logging, es_client, downloader
 from .api import health_check, router_func
+from .agent import provider_registry
+from .agent.mappings import ensure_cv_index
+from .agent.providers.converter import shutdown_executor
 
 
-# create lifespan, start db
-# @asynccontextmanager
-# async def lifespan(app: FastAPI):
-#     # load all model
-#     # if use ollama, only create client, server already started
-#     generation_manager = GenerationManager()
-#     app.state.model_gen = await generation_manager.init_model()
+# create lifespan, load providers once per process
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # load all model, every request reuses the same providers
+    # if use ollama, only create client, server already started
+    app.state.model_gen, app.state.model_emb = await provider_registry.init_model()
+    app.state.es_client = es_client.get()
+    await ensure_cv_index(app.state.es_client, os.environ["ES_CV_INDEX"])
 
-#     embedding_manager = EmbeddingManager()
-#     app.state.model_emb = await embedding_manager.init_model()
+    yield
 
-#     yield
+    await es_client.close()
+    await downloader.close()
+    shutdown_executor()
 
 
 def create_app() -> FastAPI:
@@ -27,7 +34,7 @@ def create_app() -> FastAPI:
 
     setup_logging()
 
-    app = FastAPI()  # , lifespan=lifespan)
+    app = FastAPI(lifespan=lifespan)
 
     app.include_router(health_check)
     app.include_router(router_func)
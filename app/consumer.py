@@ -1,18 +1,16 @@
 import json
 import logging
-import traceback
 import os
 import time
+import traceback
 import requests
 
 import signal
-from multiprocessing.pool import ThreadPool
-from threading import Event, Lock
 
-from kafka import KafkaConsumer, KafkaProducer
 from dotenv import load_dotenv
 
-from .core import setup_logging
+from .core import setup_logging, es_client, downloader, SUPPORTED_SUFFIXES
+from .core.kafka import BatchConsumer
 
 
 if os.environ.get("APP_ENV") != "production":
@@ -23,92 +21,86 @@ logger = logging.getLogger(__name__)
 logger.info(os.environ.get("APP_ENV"))
 
 
-class ResumeConsumer:
+class ResumeConsumer(BatchConsumer):
     def __init__(self):
         time.sleep(20)
         logger.info("Starting ....")
 
-        self.process = int(os.environ["PROCESS"])
-        self.pool = ThreadPool(self.process)
-        self.lock = Lock()
-        self.stop_event = Event()
-
-        self.consumer = KafkaConsumer(
-            bootstrap_servers=os.environ["KAFKA"].split(","),
-            auto_offset_reset=os.environ["OFFSET"],
+        super().__init__(
+            topic_recv="extract_cv_request",
+            topic_send="extract_cv_result",
             group_id=os.environ["GROUP_ID"],
-            value_deserializer=lambda m: json.loads(m),
-        )
-        self.consumer.subscribe(["extract_cv_request"])
-
-        self.producer = KafkaProducer(
-            bootstrap_servers=os.environ["KAFKA"].split(","),
-            value_serializer=lambda v: json.dumps(v).encode(),
         )
-        self.topic_send = "extract_cv_result"
 
         self.api_url = f"http://0.0.0.0:{os.environ['PORT']}/api/resumes/extract"
         logger.info(self.api_url)
         self.headers = {"Content-Type": "application/json"}
 
-    def run(self):
-        while True:
-            try:
-                with self.lock:
-                    data = self.consumer.poll(timeout_ms=5000, max_records=1)
-                    if len(data) == 0:
-                        # logger.info("Data empty")
-                        time.sleep(10)
-
-                for _, items in data.items():
-                    for item in items:
-                        item: dict = item.value
-                        logger.info(item)
+    async def setup(self):
+        # import here, the http mode does not need to load the models
+        from .agent import provider_registry
+        from .agent.mappings import ensure_cv_index
+
+        self.model_gen, self.model_emb = await provider_registry.init_model()
+        self.es_client = es_client.get()
+        await ensure_cv_index(self.es_client, os.environ["ES_CV_INDEX"])
+
+    @staticmethod
+    def _get_url(item: dict):
+        if os.environ.get("ENV", "production") == "production":
+            return item.get("local_url")
+        return item.get("public_url")
+
+    def handle(self, item: dict) -> dict:
+        cv_id = item.get("cv_id")
+        cv_url = self._get_url(item)
+
+        logger.info(cv_url)
+        payload = json.dumps({"cv_url": cv_url, "cv_id": cv_id})
+        response = requests.request(
+            "POST", self.api_url, headers=self.headers, data=payload
+        )
 
-                        cv_id = item.get("cv_id")
-                        if os.environ.get("ENV", "production") == "production":
-                            cv_url = item.get("local_url")
-                        else:
-                            cv_url = item.get("public_url")
+        results = response.json()
+        results["cv_id"] = cv_id
+        results["job_id"] = item.get("job_id")
 
-                        logger.info(cv_url)
-                        payload = json.dumps({"cv_url": cv_url, "cv_id": cv_id})
-                        response = requests.request(
-                            "POST", self.api_url, headers=self.headers, data=payload
-                        )
+        return results
 
-                        logger.info(response.json())
-                        results = response.json()
-                        results["cv_id"] = cv_id
-                        results["job_id"] = item.get("job_id")
+    async def handle_async(self, item: dict) -> dict:
+        from .agent import ResumeService
 
-                        self.producer.send(topic=self.topic_send, value=results)
+        cv_id = item.get("cv_id")
+        cv_url = self._get_url(item)
+        results = {"cv_id": cv_id, "job_id": item.get("job_id")}
 
-                if self.stop_event.is_set():
-                    return
+        logger.info(cv_url)
+        try:
+            downloaded = await downloader.fetch(cv_url)
+            if not downloaded.content or downloaded.suffix not in SUPPORTED_SUFFIXES:
+                raise ValueError("Invalid file. Please upload a valid file.")
 
-            except Exception as e:
-                logger.error(traceback.format_exc())
-                # self.producer.send(topic=self.topic_send, value=info.results)
+            resume_service = ResumeService(self.model_gen, self.model_emb, self.es_client)
+            gen_res, gen_res_format = await resume_service.extract_and_store(
+                downloaded.content, None, cv_url, cv_id, downloaded.suffix
+            )
 
-    def start(self):
-        for _ in range(self.process):
-            self.pool.apply_async(func=self.run)
+        except Exception as e:
+            # same shape as the API error response
+            logger.error(traceback.format_exc())
+            return {"detail": str(e), **results}
 
-        self.stop_event.wait()
-        # self.pool.close()
-        # self.pool.join()
+        return {
+            "filename": cv_url,
+            "info_extract": gen_res_format,
+            "info_extract_raw": gen_res,
+            **results,
+        }
 
 
 def signal_handler(sig, frame):
     print("Ctrl+C received ...")
-
     bi.stop_event.set()
-    bi.pool.close()
-    bi.pool.join()
-
-    print("All threads are done. Exiting.")
-    logger.info("All threads are done. Exiting.")
 
 
 if __name__ == "__main__":
@@ -1,5 +1,14 @@
 from .log_config import setup_logging
 from .setting import settings
+from .elastic import es_client
+from .downloader import downloader, DownloadError, SUPPORTED_SUFFIXES
 
 
-__all__ = ["setup_logging", "settings"]
+__all__ = [
+    "setup_logging",
+    "settings",
+    "es_client",
+    "downloader",
+    "DownloadError",
+    "SUPPORTED_SUFFIXES",
+]
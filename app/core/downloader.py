@@ -0,0 +1,155 @@
+import asyncio
+import codecs
+import io
+import logging
+import os
+import zipfile
+
+import httpx
+
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlsplit
+
+from .setting import settings
+
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_SUFFIXES = (".pdf", ".docx", ".txt")
+
+# bytes of the body decoded to tell plain text from binary
+_TEXT_PROBE_BYTES = 1024
+
+_CONTENT_TYPE_SUFFIX = {
+    "application/pdf": ".pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": ".docx",
+    "text/plain": ".txt",
+}
+
+
+class DownloadError(ValueError):
+    """Raised when a remote file can not be fetched or is not acceptable"""
+
+
+@dataclass
+class DownloadedFile:
+    content: bytes
+    suffix: Optional[str]
+    content_type: Optional[str]
+
+
+def _is_docx(content: bytes) -> bool:
+    try:
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            return "word/document.xml" in archive.namelist()
+    except zipfile.BadZipFile:
+        return False
+
+
+def sniff_suffix(url: str, content_type: Optional[str], content: bytes) -> Optional[str]:
+    """
+    Guess the file suffix from the url path, then the Content-Type header,
+    then the body.
+    """
+    suffix = os.path.splitext(urlsplit(url).path)[1].lower()
+    if suffix in SUPPORTED_SUFFIXES:
+        return suffix
+
+    if content_type:
+        suffix = _CONTENT_TYPE_SUFFIX.get(content_type.split(";")[0].strip().lower())
+        if suffix:
+            return suffix
+
+    if content.startswith(b"%PDF"):
+        return ".pdf"
+    # docx is a zip container holding word/document.xml
+    if content.startswith(b"PK\x03\x04"):
+        return ".docx" if _is_docx(content) else None
+    try:
+        # incremental: a multibyte character cut at the end of the probe is fine
+        codecs.getincrementaldecoder("utf-8")().decode(content[:_TEXT_PROBE_BYTES])
+        return ".txt"
+    except UnicodeDecodeError:
+        return None
+
+
+class Downloader:
+    """
+    Process-wide async HTTP client used to fetch CVs by url.
+
+    Connections are pooled, each host gets at most DOWNLOAD_MAX_PER_HOST
+    concurrent downloads and bodies are streamed into a buffer capped at
+    DOWNLOAD_MAX_BYTES.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        # host -> [semaphore, downloads using it], dropped when unused
+        self._host_slots: dict[str, list] = {}
+
+    def get(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(settings.DOWNLOAD_TIMEOUT, connect=10),
+                limits=httpx.Limits(
+                    max_connections=settings.DOWNLOAD_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.DOWNLOAD_MAX_CONNECTIONS,
+                ),
+                follow_redirects=True,
+            )
+
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @asynccontextmanager
+    async def _host_slot(self, url: str):
+        host = urlsplit(url).netloc
+        slot = self._host_slots.setdefault(
+            host, [asyncio.Semaphore(settings.DOWNLOAD_MAX_PER_HOST), 0]
+        )
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0:
+                del self._host_slots[host]
+
+    async def fetch(self, url: str) -> DownloadedFile:
+        max_bytes = settings.DOWNLOAD_MAX_BYTES
+
+        async with self._host_slot(url):
+            try:
+                async with self.get().stream("GET", url) as response:
+                    response.raise_for_status()
+
+                    length = response.headers.get("content-length")
+                    if length and length.isdigit() and int(length) > max_bytes:
+                        raise DownloadError(f"File is too large: {length} bytes")
+
+                    buffer = bytearray()
+                    async for chunk in response.aiter_bytes():
+                        buffer.extend(chunk)
+                        if len(buffer) > max_bytes:
+                            raise DownloadError(f"File is larger than {max_bytes} bytes")
+
+                    content_type = response.headers.get("content-type")
+
+            except httpx.HTTPError as e:
+                raise DownloadError(f"Can not download file: {e}") from e
+
+        content = bytes(buffer)
+        suffix = sniff_suffix(url, content_type, content)
+        logger.info(f"Downloaded {len(content)} bytes ({content_type}, {suffix})")
+
+        return DownloadedFile(content=content, suffix=suffix, content_type=content_type)
+
+
+downloader = Downloader()
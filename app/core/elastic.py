@@ -0,0 +1,73 @@
+import logging
+
+from elasticsearch import AsyncElasticsearch
+
+from .setting import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class ElasticClient:
+    """
+    Holder of the process-wide AsyncElasticsearch client.
+
+    The client keeps one connection pool per node and is created lazily on
+    first use, then shared by every service until `close` is called at
+    shutdown.
+    """
+
+    def __init__(self):
+        self._client: AsyncElasticsearch | None = None
+
+    def get(self) -> AsyncElasticsearch:
+        if self._client is None:
+            logger.info(f"Connecting to Elasticsearch: {settings.ES_HOST}")
+            self._client = AsyncElasticsearch(
+                hosts=settings.ES_HOST.split(","),
+                connections_per_node=settings.ES_CONNECTIONS_PER_NODE,
+                request_timeout=settings.ES_REQUEST_TIMEOUT,
+                max_retries=settings.ES_MAX_RETRIES,
+                retry_on_timeout=settings.ES_RETRY_ON_TIMEOUT,
+                retry_on_status=(429, 502, 503, 504),
+            )
+
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    def pool_stats(self) -> dict:
+        """
+        Connection usage per node, read from the underlying aiohttp connectors.
+        """
+        if self._client is None:
+            return {"connected": False, "nodes": []}
+
+        nodes = []
+        for node in self._client.transport.node_pool.all():
+            session = getattr(node, "session", None)
+            connector = getattr(session, "connector", None)
+            # private aiohttp attributes, reported as 0 if they ever go away
+            in_use = len(getattr(connector, "_acquired", None) or ())
+            idle = sum(len(v) for v in (getattr(connector, "_conns", None) or {}).values())
+
+            nodes.append(
+                {
+                    "node": str(node.base_url),
+                    # elastic_transport sizes the pool with limit_per_host,
+                    # `limit` is aiohttp's global default
+                    "limit": getattr(
+                        connector, "limit_per_host", settings.ES_CONNECTIONS_PER_NODE
+                    ),
+                    "in_use": in_use,
+                    "idle": idle,
+                }
+            )
+
+        return {"connected": True, "nodes": nodes}
+
+
+es_client = ElasticClient()
@@ -0,0 +1,342 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import traceback
+
+import orjson
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from threading import Event, Thread
+from typing import Optional
+
+from kafka import KafkaConsumer, KafkaProducer, ConsumerRebalanceListener
+from kafka.structs import OffsetAndMetadata, TopicPartition
+
+from .setting import settings
+from .elastic import es_client
+from .downloader import downloader
+
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryError(Exception):
+    """A result (and its dead letter) could not be produced, the record must
+    be consumed again"""
+
+
+class ProducerMetrics:
+    """Delivery counters fed by the producer callbacks"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.delivered = 0
+        self.failed = 0
+        self.bytes = 0
+        self._last_log = time.monotonic()
+
+    def on_send(self, size: int):
+        with self._lock:
+            self.sent += 1
+            self.bytes += size
+
+    def on_delivered(self, _metadata=None):
+        with self._lock:
+            self.delivered += 1
+
+    def on_failed(self, exc: BaseException):
+        with self._lock:
+            self.failed += 1
+        logger.error(f"Kafka delivery failed: {exc}")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "sent": self.sent,
+                "delivered": self.delivered,
+                "failed": self.failed,
+                "bytes": self.bytes,
+            }
+
+    def maybe_log(self, interval: float = 60):
+        now = time.monotonic()
+        if now - self._last_log >= interval:
+            self._last_log = now
+            logger.info(f"Kafka producer: {self.snapshot()}")
+
+
+def serialize(value) -> bytes:
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+
+
+def create_producer() -> KafkaProducer:
+    """
+    Result producer shared by the consumers, tuned for throughput: records are
+    batched for KAFKA_LINGER_MS and compressed with KAFKA_COMPRESSION. Values
+    are sent as bytes, see `serialize`.
+    """
+    return KafkaProducer(
+        bootstrap_servers=os.environ["KAFKA"].split(","),
+        linger_ms=settings.KAFKA_LINGER_MS,
+        batch_size=settings.KAFKA_BATCH_SIZE,
+        compression_type=settings.KAFKA_COMPRESSION or None,
+        max_request_size=settings.KAFKA_MAX_REQUEST_SIZE,
+        acks="all",
+    )
+
+
+class _CommitOnRevoke(ConsumerRebalanceListener):
+    def __init__(self, owner: "BatchConsumer"):
+        self.owner = owner
+
+    def on_partitions_revoked(self, revoked):
+        self.owner._commit_done(revoked)
+        for tp in revoked:
+            self.owner._pending.pop(tp, None)
+
+    def on_partitions_assigned(self, assigned):
+        pass
+
+
+class BatchConsumer(ABC):
+    """
+    Poll records in batches and process them on a worker pool.
+
+    * One thread owns the KafkaConsumer (it is not thread safe): it polls,
+      dispatches records to workers and commits offsets
+    * An offset is committed only when every record up to it has been handled
+      and its result delivered to `topic_send`. A failed delivery is retried
+      KAFKA_SEND_RETRIES times, then a dead letter (input record and error)
+      goes to KAFKA_DEAD_LETTER_TOPIC. If that fails too the partition is
+      rewound to the record, so results are produced at least once
+    * A record whose handler raises is sent to the dead-letter topic with the
+      error before its offset is committed
+    * When `max_inflight` records are being processed the partitions are
+      paused, polling continues so the consumer stays in the group
+    * Subclasses implement `handle(item) -> dict` (CONSUMER_MODE=http) and
+      `handle_async(item) -> dict` (CONSUMER_MODE=inprocess). In-process
+      records run as coroutines on an event loop owned by the consumer, so
+      services are called directly instead of through the API
+    """
+
+    def __init__(self, topic_recv: str, topic_send: str, group_id: str):
+        self.process = int(os.environ["PROCESS"])
+        self.max_inflight = settings.KAFKA_MAX_INFLIGHT or self.process * 2
+        self.executor = ThreadPoolExecutor(self.process)
+        self.stop_event = Event()
+
+        self.consumer = KafkaConsumer(
+            bootstrap_servers=os.environ["KAFKA"].split(","),
+            auto_offset_reset=os.environ["OFFSET"],
+            group_id=group_id,
+            enable_auto_commit=False,
+            max_poll_interval_ms=settings.KAFKA_MAX_POLL_INTERVAL_MS,
+            value_deserializer=orjson.loads,
+        )
+        self.consumer.subscribe([topic_recv], listener=_CommitOnRevoke(self))
+
+        self.producer = create_producer()
+        self.producer_metrics = ProducerMetrics()
+        self.topic_send = topic_send
+        self.topic_dead_letter = settings.KAFKA_DEAD_LETTER_TOPIC or f"{topic_send}-dlq"
+        # re-sends are not made from the producer's I/O thread
+        self._retry_executor = ThreadPoolExecutor(1)
+
+        # partition -> {offset: future}, in the order records were polled
+        self._pending: dict[TopicPartition, OrderedDict[int, Future]] = {}
+
+        self.in_process = settings.CONSUMER_MODE == "inprocess"
+        if self.in_process:
+            logger.info("Running pipeline in process ....")
+            self.loop = asyncio.new_event_loop()
+            self._loop_thread = Thread(target=self.loop.run_forever, daemon=True)
+            self._loop_thread.start()
+            asyncio.run_coroutine_threadsafe(self.setup(), self.loop).result()
+
+    async def setup(self):
+        """Create the shared clients/providers used by `handle_async`"""
+
+    async def teardown(self):
+        await es_client.close()
+        await downloader.close()
+
+    @abstractmethod
+    def handle(self, item: dict) -> dict:
+        """Process one record through the API (CONSUMER_MODE=http)"""
+
+    @abstractmethod
+    async def handle_async(self, item: dict) -> dict:
+        """Process one record in process (CONSUMER_MODE=inprocess)"""
+
+    def prepare(self, results: dict) -> dict:
+        """Hook to trim the result payload before it is sent"""
+        return results
+
+    def _on_delivered(self, done: Future, metadata):
+        self.producer_metrics.on_delivered(metadata)
+        done.set_result(None)
+
+    def _on_failed(self, item: dict, payload: bytes, attempt: int, done: Future, exc):
+        self.producer_metrics.on_failed(exc)
+        if attempt < settings.KAFKA_SEND_RETRIES:
+            self._retry_executor.submit(self._send_payload, item, payload, done, attempt + 1)
+        else:
+            self._retry_executor.submit(
+                self._send_dead_letter, item, done, exc, len(payload)
+            )
+
+    def _on_dead_letter_failed(self, done: Future, exc: BaseException):
+        self.producer_metrics.on_failed(exc)
+        done.set_exception(DeliveryError(str(exc)))
+
+    def _send_payload(self, item: dict, payload: bytes, done: Future, attempt: int = 0):
+        try:
+            send_future = self.producer.send(topic=self.topic_send, value=payload)
+        except Exception as e:
+            self._on_failed(item, payload, attempt, done, e)
+            return
+
+        send_future.add_callback(self._on_delivered, done)
+        send_future.add_errback(
+            lambda exc: self._on_failed(item, payload, attempt, done, exc)
+        )
+
+    def _send_dead_letter(
+        self, item: dict, done: Future, exc: BaseException, size: Optional[int] = None
+    ):
+        """`size` is the result payload size when its delivery failed, None
+        when the handler failed"""
+        logger.error(f"No result for {item}, sending it to {self.topic_dead_letter}")
+        dead_letter = {
+            "item": item,
+            "topic": self.topic_send,
+            "error": f"{type(exc).__name__}: {exc}",
+        }
+        if size is not None:
+            dead_letter["payload_bytes"] = size
+        payload = serialize(dead_letter)
+        try:
+            send_future = self.producer.send(topic=self.topic_dead_letter, value=payload)
+        except Exception as e:
+            self._on_dead_letter_failed(done, e)
+            return
+
+        send_future.add_callback(self._on_delivered, done)
+        send_future.add_errback(self._on_dead_letter_failed, done)
+
+    def _send(self, item: dict, results: dict, done: Future):
+        payload = serialize(self.prepare(results))
+        self.producer_metrics.on_send(len(payload))
+        self._send_payload(item, payload, done)
+
+    def _process(self, item: dict, done: Future):
+        try:
+            logger.info(item)
+            results = self.handle(item)
+            logger.info(results)
+            self._send(item, results, done)
+
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            self._send_dead_letter(item, done, e)
+
+    async def _process_async(self, item: dict, done: Future):
+        try:
+            logger.info(item)
+            results = await self.handle_async(item)
+            logger.info(results)
+            self._send(item, results, done)
+
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            self._send_dead_letter(item, done, e)
+
+    def _inflight(self) -> int:
+        return sum(len(v) for v in self._pending.values())
+
+    def _commit_done(self, partitions=None):
+        offsets = {}
+        for tp in partitions if partitions is not None else list(self._pending):
+            pending = self._pending.get(tp)
+            if not pending:
+                continue
+
+            last_done = None
+            while pending:
+                offset, future = next(iter(pending.items()))
+                if not future.done():
+                    break
+                if future.exception() is not None:
+                    # neither a result nor a dead letter was produced, consume
+                    # it again, later records in flight are produced twice
+                    logger.error(f"Rewinding {tp.topic}-{tp.partition} to {offset}")
+                    pending.clear()
+                    self.consumer.seek(tp, offset)
+                    break
+                pending.popitem(last=False)
+                last_done = offset
+
+            if last_done is not None:
+                offsets[tp] = OffsetAndMetadata(last_done + 1, "", -1)
+
+        if offsets:
+            self.consumer.commit(offsets)
+
+    def _dispatch(self, data: dict):
+        for tp, records in data.items():
+            pending = self._pending.setdefault(tp, OrderedDict())
+            for record in records:
+                done = Future()
+                pending[record.offset] = done
+                if self.in_process:
+                    asyncio.run_coroutine_threadsafe(
+                        self._process_async(record.value, done), self.loop
+                    )
+                else:
+                    self.executor.submit(self._process, record.value, done)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                inflight = self._inflight()
+                if inflight >= self.max_inflight:
+                    self.consumer.pause(*self.consumer.assignment())
+                elif self.consumer.paused():
+                    self.consumer.resume(*self.consumer.paused())
+
+                data = self.consumer.poll(
+                    timeout_ms=settings.KAFKA_POLL_TIMEOUT_MS,
+                    max_records=max(self.max_inflight - inflight, 1),
+                )
+                self._dispatch(data)
+                self._commit_done()
+                self.producer_metrics.maybe_log()
+
+            except Exception:
+                logger.error(traceback.format_exc())
+
+    def start(self):
+        try:
+            self.run()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        logger.info("Waiting for in-flight records ....")
+        self.executor.shutdown(wait=True)
+        wait([f for pending in self._pending.values() for f in pending.values()])
+        self._retry_executor.shutdown(wait=True)
+        if self.in_process:
+            asyncio.run_coroutine_threadsafe(self.teardown(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self.producer.flush()
+        self._commit_done()
+        logger.info(f"Kafka producer: {self.producer_metrics.snapshot()}")
+        self.consumer.close(autocommit=False)
+        self.producer.close()
+        logger.info("All threads are done. Exiting.")
@@ -17,10 +17,125 @@ class Settings:
     LL_MODEL: str = os.environ.get("LL_MODEL")
     LL_MODEL_CKPT_PATH: Optional[str] = os.environ.get("LL_MODEL_CKPT_PATH")
     TORCH_DTYPE: Optional[str] = os.environ.get("TORCH_DTYPE")
+    # 0: text only, 1: every PDF page as image, 2: text, images for scanned pages
     USE_VISION: Optional[int] = int(os.environ.get("USE_VISION", 0))
+    # PDF pages with fewer extractable characters are sent as images (USE_VISION=2)
+    ADAPTIVE_MIN_PAGE_CHARS: int = int(os.environ.get("ADAPTIVE_MIN_PAGE_CHARS", 100))
+    # PDF rasterization for the vision model
+    VISION_DPI: int = int(os.environ.get("VISION_DPI", 144))
+    VISION_MAX_PAGES: int = int(os.environ.get("VISION_MAX_PAGES", 8))
+    VISION_MIN_PIXELS: int = int(os.environ.get("VISION_MIN_PIXELS", 256 * 28 * 28))
+    VISION_MAX_PIXELS: int = int(os.environ.get("VISION_MAX_PIXELS", 1280 * 28 * 28))
+    VISION_JPEG_QUALITY: int = int(os.environ.get("VISION_JPEG_QUALITY", 85))
+    # processes for PDF/DOCX conversion, 0 converts on the threadpool instead
+    CONVERT_WORKERS: int = int(os.environ.get("CONVERT_WORKERS", min(os.cpu_count() or 1, 4)))
+    # largest file written to a temporary file when stream conversion fails
+    CONVERT_SPOOL_MAX_BYTES: int = int(os.environ.get("CONVERT_SPOOL_MAX_BYTES", 20 * 1024 * 1024))
+    # converted documents kept in memory, 0 disables the cache
+    CONVERT_CACHE_MAX_BYTES: int = int(os.environ.get("CONVERT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+    CONVERT_CACHE_MAX_ENTRIES: int = int(os.environ.get("CONVERT_CACHE_MAX_ENTRIES", 10000))
+
+    # shared async http pool to the Ollama server
+    OLLAMA_MAX_CONNECTIONS: int = int(os.environ.get("OLLAMA_MAX_CONNECTIONS", 32))
+    OLLAMA_TIMEOUT: float = float(os.environ.get("OLLAMA_TIMEOUT", 600))
+    # stream generations and stop once the JSON object is closed
+    OLLAMA_STREAM: bool = os.environ.get("OLLAMA_STREAM", "1") == "1"
+    # keep the model (and its prompt cache) loaded, a negative duration never unloads
+    OLLAMA_KEEP_ALIVE: str = os.environ.get("OLLAMA_KEEP_ALIVE", "1h")
+    # fixed for every call, a different num_ctx reloads the model and drops the cache
+    OLLAMA_NUM_CTX: int = int(os.environ.get("OLLAMA_NUM_CTX", 12288))
+
+    # pass the prompt JSON schemas to ollama `format=`
+    OLLAMA_STRUCTURED_OUTPUT: bool = os.environ.get("OLLAMA_STRUCTURED_OUTPUT", "1") == "1"
+
+    # documents are cleaned and cut to OLLAMA_NUM_CTX minus the prompt and this
+    # reserve for the answer, 0 sends them whole
+    CONTEXT_OUTPUT_TOKENS: int = int(os.environ.get("CONTEXT_OUTPUT_TOKENS", 4096))
+    # token budget of the JD and the resume in each review prompt, 0 disables
+    REVIEW_JD_MAX_TOKENS: int = int(os.environ.get("REVIEW_JD_MAX_TOKENS", 2048))
+    REVIEW_RESUME_MAX_TOKENS: int = int(os.environ.get("REVIEW_RESUME_MAX_TOKENS", 4096))
 
     EMBEDDING_PROVIDER: str = os.environ.get("EMBEDDING_PROVIDER")
     EMBEDDING_MODEL: str = os.environ.get("EMBEDDING_MODEL")
+    EMBEDDING_DIMENSIONS: int = int(os.environ.get("EMBEDDING_DIMENSIONS", 1024))
+    # in-memory entries, plus an optional SQLite tier (empty path disables it)
+    EMBEDDING_CACHE_SIZE: int = int(os.environ.get("EMBEDDING_CACHE_SIZE", 10000))
+    EMBEDDING_CACHE_PATH: str = os.environ.get("EMBEDDING_CACHE_PATH", "./cache/embedding.db")
+    EMBEDDING_CACHE_MAX_ENTRIES: int = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", 500000))
+
+    # concurrent candidate reviews per process, over all JDs in flight,
+    # keep <= OLLAMA_NUM_PARALLEL
+    REVIEW_CONCURRENCY: int = int(
+        os.environ.get("REVIEW_CONCURRENCY", os.environ.get("OLLAMA_NUM_PARALLEL", 4))
+    )
+    # hits fetched by each retriever, then fused down to RETRIEVAL_SIZE
+    RETRIEVAL_CANDIDATES: int = int(os.environ.get("RETRIEVAL_CANDIDATES", 20))
+    RETRIEVAL_SIZE: int = int(os.environ.get("RETRIEVAL_SIZE", 10))
+    # rrf or weighted
+    RETRIEVAL_FUSION: str = os.environ.get("RETRIEVAL_FUSION", "rrf")
+    RETRIEVAL_RRF_K: int = int(os.environ.get("RETRIEVAL_RRF_K", 60))
+    RETRIEVAL_KEYWORD_WEIGHT: float = float(os.environ.get("RETRIEVAL_KEYWORD_WEIGHT", 0.5))
+    RETRIEVAL_VECTOR_WEIGHT: float = float(os.environ.get("RETRIEVAL_VECTOR_WEIGHT", 0.5))
+
+    # cheap scoring between retrieval and review, only REVIEW_TOP_N reach the LLM,
+    # it drops nobody unless REVIEW_TOP_N < RETRIEVAL_SIZE
+    PRERANK_ENABLED: bool = os.environ.get("PRERANK_ENABLED", "1") == "1"
+    REVIEW_TOP_N: int = int(os.environ.get("REVIEW_TOP_N", 5))
+    PRERANK_VECTOR_WEIGHT: float = float(os.environ.get("PRERANK_VECTOR_WEIGHT", 0.6))
+    PRERANK_KEYWORD_WEIGHT: float = float(os.environ.get("PRERANK_KEYWORD_WEIGHT", 0.4))
+    PRERANK_EXPERIENCE_TOLERANCE: float = float(os.environ.get("PRERANK_EXPERIENCE_TOLERANCE", 0))
+
+    # empty path disables the review cache
+    REVIEW_CACHE_PATH: str = os.environ.get("REVIEW_CACHE_PATH", "./cache/review.db")
+    REVIEW_CACHE_TTL: int = int(os.environ.get("REVIEW_CACHE_TTL", 7 * 24 * 3600))
+    REVIEW_CACHE_MAX_ENTRIES: int = int(os.environ.get("REVIEW_CACHE_MAX_ENTRIES", 200000))
+
+    # batch extraction
+    BATCH_MAX_ITEMS: int = int(os.environ.get("BATCH_MAX_ITEMS", 100))
+    BATCH_CONCURRENCY: int = int(os.environ.get("BATCH_CONCURRENCY", 4))
+    BATCH_BULK_CHUNK_SIZE: int = int(os.environ.get("BATCH_BULK_CHUNK_SIZE", 200))
+
+    # python -m app.reembed: texts per embed call, documents per second (0 no limit)
+    REEMBED_BATCH_SIZE: int = int(os.environ.get("REEMBED_BATCH_SIZE", 64))
+    REEMBED_MAX_RATE: float = float(os.environ.get("REEMBED_MAX_RATE", 20))
+
+    DOWNLOAD_TIMEOUT: float = float(os.environ.get("DOWNLOAD_TIMEOUT", 30))
+    DOWNLOAD_MAX_BYTES: int = int(os.environ.get("DOWNLOAD_MAX_BYTES", 20 * 1024 * 1024))
+    DOWNLOAD_MAX_CONNECTIONS: int = int(os.environ.get("DOWNLOAD_MAX_CONNECTIONS", 50))
+    DOWNLOAD_MAX_PER_HOST: int = int(os.environ.get("DOWNLOAD_MAX_PER_HOST", 8))
+
+    # http: post records to the API, inprocess: call the services directly
+    CONSUMER_MODE: str = os.environ.get("CONSUMER_MODE", "http")
+    KAFKA_POLL_TIMEOUT_MS: int = int(os.environ.get("KAFKA_POLL_TIMEOUT_MS", 500))
+    # records processed at once per consumer, 0 -> 2 * PROCESS
+    KAFKA_MAX_INFLIGHT: int = int(os.environ.get("KAFKA_MAX_INFLIGHT", 0))
+    KAFKA_MAX_POLL_INTERVAL_MS: int = int(os.environ.get("KAFKA_MAX_POLL_INTERVAL_MS", 600000))
+
+    KAFKA_LINGER_MS: int = int(os.environ.get("KAFKA_LINGER_MS", 20))
+    KAFKA_BATCH_SIZE: int = int(os.environ.get("KAFKA_BATCH_SIZE", 256 * 1024))
+    # gzip, snappy, lz4, zstd or empty for none
+    KAFKA_COMPRESSION: str = os.environ.get("KAFKA_COMPRESSION", "lz4")
+    # keep <= the broker/topic max.message.bytes (broker default ~1 MiB)
+    KAFKA_MAX_REQUEST_SIZE: int = int(os.environ.get("KAFKA_MAX_REQUEST_SIZE", 1024 * 1024))
+    # failed result deliveries are retried, then a dead letter goes to
+    # KAFKA_DEAD_LETTER_TOPIC (default "<result topic>-dlq")
+    KAFKA_SEND_RETRIES: int = int(os.environ.get("KAFKA_SEND_RETRIES", 3))
+    KAFKA_DEAD_LETTER_TOPIC: str = os.environ.get("KAFKA_DEAD_LETTER_TOPIC", "")
+    # ship the full CV text in recommend_cv_result.top_cv
+    KAFKA_RESULT_INCLUDE_CONTENT: bool = os.environ.get("KAFKA_RESULT_INCLUDE_CONTENT", "0") == "1"
+
+    ES_HOST: str = os.environ.get("ES_HOST", "http://localhost:9200")
+    ES_CONNECTIONS_PER_NODE: int = int(os.environ.get("ES_CONNECTIONS_PER_NODE", 20))
+    ES_REQUEST_TIMEOUT: float = float(os.environ.get("ES_REQUEST_TIMEOUT", 30))
+    ES_MAX_RETRIES: int = int(os.environ.get("ES_MAX_RETRIES", 3))
+    ES_RETRY_ON_TIMEOUT: bool = os.environ.get("ES_RETRY_ON_TIMEOUT", "1") == "1"
+
+    ES_VECTOR_INDEX_TYPE: str = os.environ.get("ES_VECTOR_INDEX_TYPE", "hnsw")
+    ES_HNSW_M: int = int(os.environ.get("ES_HNSW_M", 16))
+    ES_HNSW_EF_CONSTRUCTION: int = int(os.environ.get("ES_HNSW_EF_CONSTRUCTION", 100))
+    # 0 -> same as the search size
+    ES_KNN_K: int = int(os.environ.get("ES_KNN_K", 0))
+    ES_KNN_NUM_CANDIDATES: int = int(os.environ.get("ES_KNN_NUM_CANDIDATES", 100))
 
 
 settings = Settings()
@@ -1,18 +1,16 @@
 import json
 import logging
-import traceback
 import os
 import time
+import traceback
 import requests
 
 import signal
-from multiprocessing.pool import ThreadPool
-from threading import Event, Lock
 
-from kafka import KafkaConsumer, KafkaProducer
 from dotenv import load_dotenv
 
-from .core import setup_logging
+from .core import setup_logging, es_client, settings
+from .core.kafka import BatchConsumer
 
 
 if os.environ.get("APP_ENV") != "production":
@@ -23,83 +21,75 @@ logger = logging.getLogger(__name__)
 logger.info(os.environ.get("APP_ENV"))
 
 
-class ResumeConsumer:
+class ResumeConsumer(BatchConsumer):
     def __init__(self):
         time.sleep(20)
         logger.info("Starting ....")
 
-        self.process = int(os.environ["PROCESS"])
-        self.pool = ThreadPool(self.process)
-        self.lock = Lock()
-        self.stop_event = Event()
-
-        self.consumer = KafkaConsumer(
-            bootstrap_servers=os.environ["KAFKA"].split(","),
-            auto_offset_reset=os.environ["OFFSET"],
+        super().__init__(
+            topic_recv="recommend_cv_request",
+            topic_send="recommend_cv_result",
             group_id=os.environ["JD_GROUP_ID"],
-            value_deserializer=lambda m: json.loads(m),
-        )
-        self.consumer.subscribe(["recommend_cv_request"])
-
-        self.producer = KafkaProducer(
-            bootstrap_servers=os.environ["KAFKA"].split(","),
-            value_serializer=lambda v: json.dumps(v).encode(),
         )
-        self.topic_send = "recommend_cv_result"
 
         self.api_url = f"http://0.0.0.0:{os.environ['PORT']}/api/jd/upload"
         logger.info(self.api_url)
         self.headers = {"Content-Type": "application/json"}
 
-    def run(self):
-        while True:
-            try:
-                with self.lock:
-                    data = self.consumer.poll(timeout_ms=5000, max_records=1)
-                    if len(data) == 0:
-                        # logger.info("Data empty")
-                        time.sleep(10)
+    async def setup(self):
+        # import here, the http mode does not need to load the models
+        from .agent import provider_registry
 
-                for _, items in data.items():
-                    for item in items:
-                        item: dict = item.value
-                        logger.info(item)
+        self.model_gen, self.model_emb = await provider_registry.init_model()
+        self.es_client = es_client.get()
 
-                        jd_id = item.get("id")
+    def prepare(self, results: dict) -> dict:
+        # consumers look CVs up by cv_id, the full text is not needed
+        if not settings.KAFKA_RESULT_INCLUDE_CONTENT:
+            for cv in results.get("top_cv", []):
+                cv.pop("content", None)
 
-                        payload = json.dumps({"jd_content": item, "jd_id": jd_id})
-                        response = requests.request(
-                            "POST", self.api_url, headers=self.headers, data=payload
-                        )
+        return results
 
-                        logger.info(response.json())
-                        results = response.json()
-                        results["jd_id"] = jd_id
+    def handle(self, item: dict) -> dict:
+        jd_id = item.get("id")
 
-                        self.producer.send(topic=self.topic_send, value=results)
+        payload = json.dumps({"jd_content": item, "jd_id": jd_id})
+        response = requests.request(
+            "POST", self.api_url, headers=self.headers, data=payload
+        )
+
+        results = response.json()
+        results["jd_id"] = jd_id
+
+        return results
 
-                if self.stop_event.is_set():
-                    return
+    async def handle_async(self, item: dict) -> dict:
+        from .agent import JDService
+        from .agent.utils import convert_top_cv_format
 
-            except Exception as e:
-                logger.error(traceback.format_exc())
+        jd_id = item.get("id")
+        try:
+            jd_service = JDService(self.model_gen, self.model_emb, self.es_client)
+            gen_res, top_cv = await jd_service.extract_match_review(
+                item, None, None, jd_id
+            )
 
-    def start(self):
-        for _ in range(self.process):
-            self.pool.apply_async(func=self.run)
+        except Exception as e:
+            # same shape as the API error response
+            logger.error(traceback.format_exc())
+            return {"detail": str(e), "jd_id": jd_id}
 
-        self.stop_event.wait()
+        return {
+            "top_cv": convert_top_cv_format(top_cv),
+            "info_extract_raw": gen_res,
+            "jd_id": jd_id,
+        }
 
 
 def signal_handler(sig, frame):
     print("Ctrl+C received ...")
-
     bi.stop_event.set()
-    bi.pool.close()
-    bi.pool.join()
-
-    print("All threads are done. Exiting.")
-    logger.info("All threads are done. Exiting.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,345 @@
+"""
+Rebuild the CV index with vectors from the configured embedding model.
+
+    EMBEDDING_MODEL=<new model> EMBEDDING_DIMENSIONS=<dims> python -m app.reembed
+
+Stored `content` is read from the index behind ES_CV_INDEX (point in time
+with search_after), embedded in batches with the configured embedding model and
+bulk-written to a new index version `<alias>-v<N>` with the current mapping.
+Documents created or updated meanwhile are caught up. The old version is
+then write blocked for a last catch up and the alias is swapped to the new
+version in one atomic request, writes through the alias fail for that short
+time instead of getting lost. Deploy the services with the new model right
+after the swap, query vectors must come from the same model.
+
+The job embeds one batch at a time and at most --max-rate documents per second,
+so live extraction and search keep most of Ollama and ES. The position is
+checkpointed, running the same command again continues the same index version.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import re
+import time
+
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Optional
+
+from elasticsearch.helpers import async_streaming_bulk
+
+from .core import setup_logging, es_client, settings
+from .agent.manager import EmbeddingManager
+from .agent.mappings import cv_index_mapping, versioned_index_name
+from .agent.providers.prompt.resume_prompt import TASK
+from .reformat import PIT_KEEP_ALIVE, Checkpoint, Progress, id_sort_field
+
+
+logger = logging.getLogger(__name__)
+
+# documents created this long before a pass started are caught up again
+CATCH_UP_MARGIN = timedelta(minutes=1)
+
+
+async def resolve_alias(client, alias: str) -> tuple[list[str], bool]:
+    """
+    Return the indices behind `alias` and whether it is a real alias. A
+    concrete index with that name (created before versioning) is returned as
+    is, it is replaced by the alias on swap.
+    """
+    if await client.indices.exists_alias(name=alias):
+        return sorted(await client.indices.get_alias(name=alias)), True
+
+    if await client.indices.exists(index=alias):
+        return [alias], False
+
+    raise SystemExit(f"Index or alias {alias} does not exist")
+
+
+async def next_index_name(client, alias: str) -> str:
+    pattern = re.compile(rf"^{re.escape(alias)}-v(\d+)$")
+    existing = await client.indices.get(index=f"{alias}-v*", allow_no_indices=True)
+    versions = [int(m.group(1)) for name in existing if (m := pattern.match(name))]
+
+    return versioned_index_name(alias, max(versions, default=0) + 1)
+
+
+async def scan(
+    client,
+    index: str,
+    query: dict,
+    batch_size: int,
+    after_id: Optional[str] = None,
+    sort_field: Optional[str] = "id",
+) -> AsyncIterator[list[dict]]:
+    """
+    Hits sorted by `sort_field` (see `id_sort_field`), documents without an id
+    come in a last unsorted pass. `after_id` resumes after that id, its own
+    documents are read again. Without `sort_field` there is one unsorted pass.
+    """
+    if sort_field is None:
+        passes = [(query, [])]
+    else:
+        passes = [
+            (
+                {"bool": {"filter": [query, {"exists": {"field": "id"}}]}},
+                [{sort_field: "asc"}],
+            ),
+            ({"bool": {"filter": [query], "must_not": [{"exists": {"field": "id"}}]}}, []),
+        ]
+    pit_id = (await client.open_point_in_time(index=index, keep_alive=PIT_KEEP_ALIVE))["id"]
+    try:
+        for pass_query, sort in passes:
+            search_after = [after_id, -1] if after_id and sort else None
+            while True:
+                resp = await client.search(
+                    pit={"id": pit_id, "keep_alive": PIT_KEEP_ALIVE},
+                    query=pass_query,
+                    sort=sort + [{"_shard_doc": "asc"}],
+                    search_after=search_after,
+                    source_excludes=["embedding_vector"],
+                    size=batch_size,
+                    track_total_hits=False,
+                )
+                pit_id = resp.get("pit_id", pit_id)
+                hits = resp["hits"]["hits"]
+                if not hits:
+                    break
+
+                search_after = hits[-1]["sort"]
+                yield hits
+
+    finally:
+        await client.close_point_in_time(id=pit_id)
+
+
+class Reembedder:
+    def __init__(self, client, model_emb, target: str, max_rate: float):
+        self.client = client
+        self.model_emb = model_emb
+        self.target = target
+        self.max_rate = max_rate
+
+    async def write(self, hits: list[dict]) -> int:
+        """Embed `content` of the hits and index them into the target, return
+        the number of failed documents."""
+        started = time.monotonic()
+        contents = [hit["_source"].get("content") or "" for hit in hits]
+        vectors = await self.model_emb(contents, TASK)
+
+        actions = [
+            {
+                "_index": self.target,
+                "_id": hit["_id"],
+                "_source": {**hit["_source"], "embedding_vector": vector},
+            }
+            for hit, vector in zip(hits, vectors)
+        ]
+
+        failed = 0
+        async for ok, info in async_streaming_bulk(
+            self.client,
+            actions,
+            chunk_size=settings.BATCH_BULK_CHUNK_SIZE,
+            raise_on_error=False,
+            raise_on_exception=False,
+        ):
+            if not ok:
+                failed += 1
+                logger.warning(f"Bulk index failed: {info}")
+
+        # leave Ollama and ES to live traffic for the rest of the time slot
+        if self.max_rate > 0:
+            await asyncio.sleep(len(hits) / self.max_rate - (time.monotonic() - started))
+
+        return failed
+
+    async def copy(
+        self,
+        source: str,
+        query: dict,
+        batch_size: int,
+        progress: Progress,
+        checkpoint: Optional[Checkpoint] = None,
+        after_id: Optional[str] = None,
+    ):
+        sort_field = await id_sort_field(self.client, source)
+        if sort_field is None:
+            logger.warning(f"No sortable id in {source}, the position is not checkpointed")
+            after_id = None
+
+        async for hits in scan(self.client, source, query, batch_size, after_id, sort_field):
+            failed = await self.write(hits)
+            progress.update(len(hits), failed)
+
+            last_id = hits[-1]["_source"].get("id")
+            if checkpoint is not None and sort_field and last_id is not None:
+                checkpoint.save(
+                    **{
+                        **checkpoint.state,
+                        "id": last_id,
+                        "processed": progress.processed,
+                        "failed": progress.failed,
+                    }
+                )
+
+
+def changed_since(since: datetime) -> dict:
+    """Documents created or updated at or after `since`"""
+    return {
+        "bool": {
+            "should": [
+                {"range": {"updated_at": {"gte": since.isoformat()}}},
+                # documents written before updated_at existed
+                {"range": {"created_at": {"gte": since.isoformat()}}},
+            ],
+            "minimum_should_match": 1,
+        }
+    }
+
+
+async def set_write_block(client, index: str, blocked: bool):
+    await client.indices.put_settings(
+        index=index, settings={"index.blocks.write": True if blocked else None}
+    )
+
+
+async def swap_alias(client, alias: str, sources: list[str], target: str, is_alias: bool):
+    if is_alias:
+        actions = [{"remove": {"index": index, "alias": alias}} for index in sources]
+    else:
+        # the old concrete index has the alias name, it is dropped in the swap
+        actions = [{"remove_index": {"index": alias}}]
+    actions.append({"add": {"index": target, "alias": alias}})
+
+    await client.indices.update_aliases(actions=actions)
+    logger.info(f"Alias {alias} now points to {target}")
+
+
+async def run(args):
+    client = es_client.get()
+    checkpoint = Checkpoint(args.checkpoint, args.restart)
+    state = checkpoint.state
+    progress = Progress(
+        state.get("processed", 0), state.get("failed", 0), label="Re-embedded"
+    )
+
+    try:
+        sources, is_alias = await resolve_alias(client, args.alias)
+        if not is_alias and not args.delete_old:
+            raise SystemExit(
+                f"{args.alias} is a concrete index, it is deleted when the alias "
+                "takes its name: rerun with --delete-old"
+            )
+
+        if state.get("target") in sources:
+            logger.info(f"{args.alias} already points to {state['target']}")
+            os.remove(args.checkpoint)
+            return
+
+        model_emb = await EmbeddingManager().init_model()
+        await model_emb.check_model()
+
+        target = state.get("target")
+        if target is None or not await client.indices.exists(index=target):
+            target = await next_index_name(client, args.alias)
+            logger.info(f"Creating index {target}")
+            # no replicas and refreshes while loading
+            await client.indices.create(
+                index=target,
+                mappings=cv_index_mapping(),
+                settings={"number_of_replicas": 0, "refresh_interval": "-1"},
+            )
+            state = {"target": target, "started_at": datetime.now(timezone.utc).isoformat()}
+            checkpoint.save(**state)
+            progress = Progress(label="Re-embedded")
+
+        replicas = (await client.indices.get_settings(index=sources[0]))[sources[0]][
+            "settings"
+        ]["index"].get("number_of_replicas", "1")
+        source = ",".join(sources)
+        progress.total = (await client.count(index=source))["count"]
+        reembedder = Reembedder(client, model_emb, target, args.max_rate)
+
+        logger.info(f"Re-embedding {sources} into {target} with {settings.EMBEDDING_MODEL}")
+        await reembedder.copy(
+            source,
+            {"match_all": {}},
+            args.batch_size,
+            progress,
+            checkpoint,
+            state.get("id"),
+        )
+
+        # documents written through the alias since the copy started
+        since = datetime.fromisoformat(state["started_at"]) - CATCH_UP_MARGIN
+        blocked_at = datetime.now(timezone.utc)
+        await reembedder.copy(source, changed_since(since), args.batch_size, progress)
+
+        # no write may land on the old version between the last catch up and
+        # the swap, the concrete index is even dropped by the swap itself
+        logger.info(f"Blocking writes to {sources}")
+        await set_write_block(client, source, True)
+        try:
+            await client.indices.refresh(index=source)
+            await reembedder.copy(
+                source,
+                changed_since(blocked_at - CATCH_UP_MARGIN),
+                args.batch_size,
+                progress,
+            )
+
+            await client.indices.put_settings(
+                index=target,
+                settings={"number_of_replicas": replicas, "refresh_interval": None},
+            )
+            await client.indices.refresh(index=target)
+            await swap_alias(client, args.alias, sources, target, is_alias)
+
+        except BaseException:
+            await set_write_block(client, source, False)
+            raise
+
+        if is_alias:
+            if args.delete_old:
+                await client.indices.delete(index=source)
+                logger.info(f"Deleted {sources}")
+            else:
+                await set_write_block(client, source, False)
+
+        progress.log()
+        os.remove(args.checkpoint)
+
+    finally:
+        await es_client.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m app.reembed",
+        description="Rebuild the CV index with vectors from the configured embedding model.",
+    )
+    parser.add_argument("--alias", default=os.environ.get("ES_CV_INDEX"))
+    parser.add_argument("--batch-size", type=int, default=settings.REEMBED_BATCH_SIZE)
+    parser.add_argument(
+        "--max-rate",
+        type=float,
+        default=settings.REEMBED_MAX_RATE,
+        help="documents per second, 0 for no limit",
+    )
+    parser.add_argument(
+        "--delete-old", action="store_true", help="delete the previous index after the swap"
+    )
+    parser.add_argument("--checkpoint", default="./cache/reembed.json")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint")
+    args = parser.parse_args(argv)
+
+    if not args.alias:
+        parser.error("--alias or ES_CV_INDEX is required")
+
+    return args
+
+
+if __name__ == "__main__":
+    setup_logging()
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,425 @@
+"""
+Re-run the format conversion over stored raw extractions.
+
+    python -m app.reformat --source es --sink es
+    python -m app.reformat --source jsonl --input dump/*.jsonl --sink jsonl --output out/
+
+Raw extractions are read from the CV index (`info_extract_raw`, point in time
+with search_after) or from JSONL files, converted with `convert_resume_format`
+on a process pool and written back as partial updates of `info_extract` or to
+sharded JSONL files. The position is checkpointed after every written batch,
+running the same command again continues from there (--restart starts over).
+"""
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import time
+import zlib
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional
+
+from elasticsearch.helpers import async_streaming_bulk
+
+from .core import setup_logging, es_client, settings
+from .agent.utils import convert_resume_format
+
+
+logger = logging.getLogger(__name__)
+
+PIT_KEEP_ALIVE = "5m"
+
+
+def _convert_batch(records: list[dict]) -> list[dict]:
+    """Runs in the worker processes, one result per record with either
+    `info_extract` or `error`."""
+    results = []
+    for record in records:
+        result = {k: v for k, v in record.items() if k != "raw"}
+        try:
+            result["info_extract"] = convert_resume_format(record["raw"])
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+        results.append(result)
+
+    return results
+
+
+class Checkpoint:
+    """Last completed position, saved atomically as JSON"""
+
+    def __init__(self, path: str, restart: bool = False):
+        self.path = path
+        self.state = {}
+        if os.path.exists(path) and not restart:
+            with open(path, encoding="utf-8") as f:
+                self.state = json.load(f)
+            logger.info(f"Resuming from checkpoint {path}: {self.state.get('position')}")
+
+    def save(self, **state):
+        self.state = state
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+
+class Progress:
+    def __init__(
+        self,
+        processed: int = 0,
+        failed: int = 0,
+        interval: float = 10,
+        label: str = "Reformatted",
+    ):
+        self.label = label
+        self.processed = processed
+        self.failed = failed
+        self.total: Optional[int] = None
+        self.interval = interval
+        self._start = time.monotonic()
+        self._start_processed = processed
+        self._last_log = self._start
+
+    def update(self, processed: int, failed: int):
+        self.processed += processed
+        self.failed += failed
+
+        now = time.monotonic()
+        if now - self._last_log >= self.interval:
+            self._last_log = now
+            self.log()
+
+    def log(self):
+        elapsed = time.monotonic() - self._start
+        rate = (self.processed - self._start_processed) / elapsed if elapsed else 0.0
+        total = f"/{self.total}" if self.total is not None else ""
+        logger.info(
+            f"{self.label} {self.processed}{total} documents, {self.failed} failed, "
+            f"{rate:.1f} docs/s"
+        )
+
+
+async def id_sort_field(client, index: str) -> Optional[str]:
+    """
+    The field to sort `id` on in every index of `index`: `id` when it is a
+    keyword (or numeric), `id.keyword` on legacy indices where it is text, None
+    when the indices disagree or have no sortable `id`.
+    """
+    resp = await client.indices.get_field_mapping(fields=["id", "id.keyword"], index=index)
+    fields = set()
+    for mapping in resp.values():
+        mappings = mapping.get("mappings", {})
+        id_type = mappings.get("id", {}).get("mapping", {}).get("id", {}).get("type")
+        if id_type is None:
+            # no document of this index has an id
+            continue
+        if id_type != "text":
+            fields.add("id")
+        elif "id.keyword" in mappings:
+            fields.add("id.keyword")
+        else:
+            return None
+
+    return fields.pop() if len(fields) == 1 else None
+
+
+async def es_source(
+    client, index: str, batch_size: int, position: Optional[dict], progress: Progress
+) -> AsyncIterator[tuple[list[dict], dict]]:
+    """
+    Documents with a raw extraction, sorted by `id`. A checkpoint only keeps
+    the last id: a new point in time does not have the same `_shard_doc`
+    values, so documents sharing that id are converted again.
+
+    `info_extract_raw` is stored but not indexed, documents without it can
+    not be filtered out in the query and are skipped here. Without a sortable
+    `id` documents come in `_shard_doc` order and a resume starts over.
+    """
+    sort_field = await id_sort_field(client, index)
+    if sort_field:
+        query = {"bool": {"filter": [{"exists": {"field": "id"}}]}}
+        sort = [{sort_field: "asc"}]
+    else:
+        logger.warning(f"No sortable id in {index}, the position is not checkpointed")
+        query = {"match_all": {}}
+        sort = []
+        position = None
+    progress.total = (await client.count(index=index, query=query))["count"]
+
+    search_after = [position["id"], -1] if position else None
+    pit_id = (await client.open_point_in_time(index=index, keep_alive=PIT_KEEP_ALIVE))["id"]
+    try:
+        while True:
+            resp = await client.search(
+                pit={"id": pit_id, "keep_alive": PIT_KEEP_ALIVE},
+                query=query,
+                sort=sort + [{"_shard_doc": "asc"}],
+                search_after=search_after,
+                source=["id", "info_extract_raw"],
+                size=batch_size,
+                track_total_hits=False,
+            )
+            pit_id = resp.get("pit_id", pit_id)
+            hits = resp["hits"]["hits"]
+            if not hits:
+                break
+
+            search_after = hits[-1]["sort"]
+            records = [
+                {
+                    "id": hit["_source"].get("id", hit["_id"]),
+                    "_id": hit["_id"],
+                    "_index": hit["_index"],
+                    "raw": hit["_source"]["info_extract_raw"],
+                }
+                for hit in hits
+                if hit["_source"].get("info_extract_raw") is not None
+            ]
+            yield records, {"id": search_after[0]} if sort else None
+
+    finally:
+        await client.close_point_in_time(id=pit_id)
+
+
+async def jsonl_source(
+    paths: list[str], batch_size: int, position: Optional[dict]
+) -> AsyncIterator[tuple[list[dict], dict]]:
+    """
+    One raw extraction per line, either the extraction itself or an object
+    with `info_extract_raw` (and `id`, `_id`, `_index` when exported from ES).
+    Positions are a file index and a byte offset.
+    """
+    position = position or {"file": 0, "offset": 0}
+    for file_index, path in enumerate(paths):
+        if file_index < position["file"]:
+            continue
+
+        with open(path, "rb") as f:
+            if file_index == position["file"]:
+                f.seek(position["offset"])
+
+            records = []
+            while line := f.readline():
+                if not line.strip():
+                    continue
+
+                offset = f.tell()
+                try:
+                    obj = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Invalid JSON in {path} before offset {offset}")
+                    continue
+
+                record = {"raw": obj.get("info_extract_raw", obj)}
+                record["id"] = obj.get("id") or obj.get("cv_id") or f"{path}:{offset}"
+                for key in ("_id", "_index"):
+                    if key in obj:
+                        record[key] = obj[key]
+                records.append(record)
+
+                if len(records) >= batch_size:
+                    yield records, {"file": file_index, "offset": offset}
+                    records = []
+
+            if records:
+                yield records, {"file": file_index, "offset": f.tell()}
+
+
+class EsSink:
+    """
+    Partial updates of `info_extract` on the source documents. Records
+    without `_index` (JSONL exports) are updated through `index`.
+    """
+
+    def __init__(self, client, chunk_size: int, index: Optional[str] = None):
+        self.client = client
+        self.chunk_size = chunk_size
+        self.index = index
+
+    async def write(self, results: list[dict]) -> int:
+        actions = []
+        failed = 0
+        # picked up by the catch up of a concurrent `python -m app.reembed`
+        now = datetime.now(timezone.utc).isoformat()
+        for result in results:
+            if "error" in result:
+                continue
+            index = result.get("_index") or self.index
+            if "_id" not in result or not index:
+                failed += 1
+                logger.warning(f"{result['id']}: no _id or index, can not update it in ES")
+                continue
+
+            actions.append(
+                {
+                    "_op_type": "update",
+                    "_index": index,
+                    "_id": result["_id"],
+                    "doc": {"info_extract": result["info_extract"], "updated_at": now},
+                }
+            )
+
+        async for ok, info in async_streaming_bulk(
+            self.client,
+            actions,
+            chunk_size=self.chunk_size,
+            raise_on_error=False,
+            raise_on_exception=False,
+        ):
+            if not ok:
+                failed += 1
+                logger.warning(f"Bulk update failed: {info}")
+
+        return failed
+
+    def state(self) -> dict:
+        return {}
+
+    def close(self):
+        pass
+
+
+class JsonlSink:
+    """
+    Results spread over `shards` files by a hash of the id. Shards are cut
+    back to their checkpointed size on resume, so no line is written twice.
+    """
+
+    def __init__(self, output: str, shards: int, sizes: Optional[dict] = None):
+        os.makedirs(output, exist_ok=True)
+        self.files = []
+        for shard in range(shards):
+            path = os.path.join(output, f"part-{shard:05d}.jsonl")
+            f = open(path, "ab")
+            f.truncate((sizes or {}).get(str(shard), 0))
+            f.seek(0, os.SEEK_END)
+            self.files.append(f)
+
+    async def write(self, results: list[dict]) -> int:
+        for result in results:
+            if "error" in result:
+                continue
+
+            shard = zlib.crc32(str(result["id"]).encode("utf-8")) % len(self.files)
+            line = json.dumps(result, ensure_ascii=False) + "\n"
+            self.files[shard].write(line.encode("utf-8"))
+
+        for f in self.files:
+            f.flush()
+
+        return 0
+
+    def state(self) -> dict:
+        return {"shard_sizes": {str(i): f.tell() for i, f in enumerate(self.files)}}
+
+    def close(self):
+        for f in self.files:
+            f.close()
+
+
+async def run(args):
+    checkpoint = Checkpoint(args.checkpoint, args.restart)
+    state = checkpoint.state
+    progress = Progress(state.get("processed", 0), state.get("failed", 0))
+
+    client = None
+    if "es" in (args.source, args.sink):
+        client = es_client.get()
+
+    if args.source == "es":
+        source = es_source(
+            client, args.index, args.batch_size, state.get("position"), progress
+        )
+    else:
+        paths = sorted(p for pattern in args.input for p in glob.glob(pattern))
+        if not paths:
+            raise SystemExit(f"No input files match {args.input}")
+        source = jsonl_source(paths, args.batch_size, state.get("position"))
+
+    if args.sink == "es":
+        sink = EsSink(client, settings.BATCH_BULK_CHUNK_SIZE, args.index)
+    else:
+        sink = JsonlSink(args.output, args.shards, state.get("shard_sizes"))
+
+    loop = asyncio.get_running_loop()
+    # spawn, same as the conversion pool: no fork of the event loop threads
+    executor = ProcessPoolExecutor(
+        max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")
+    )
+    # converted in parallel, written and checkpointed in source order
+    pending = deque()
+
+    async def write_next():
+        future, position = pending.popleft()
+        results = await future
+        failed = sum("error" in result for result in results)
+        for result in results:
+            if "error" in result:
+                logger.warning(f"{result['id']}: {result['error']}")
+
+        failed += await sink.write(results)
+        progress.update(len(results), failed)
+        checkpoint.save(
+            position=position,
+            processed=progress.processed,
+            failed=progress.failed,
+            **sink.state(),
+        )
+
+    try:
+        async for records, position in source:
+            pending.append(
+                (loop.run_in_executor(executor, _convert_batch, records), position)
+            )
+            if len(pending) >= args.workers * 2:
+                await write_next()
+
+        while pending:
+            await write_next()
+
+    finally:
+        executor.shutdown(cancel_futures=True)
+        sink.close()
+        await es_client.close()
+
+    progress.log()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m app.reformat",
+        description="Re-run the format conversion over stored raw extractions.",
+    )
+    parser.add_argument("--source", choices=["es", "jsonl"], default="es")
+    parser.add_argument("--input", nargs="+", default=[], help="JSONL files or globs")
+    parser.add_argument("--index", default=os.environ.get("ES_CV_INDEX"))
+    parser.add_argument("--sink", choices=["es", "jsonl"], default="es")
+    parser.add_argument("--output", default="./reformatted", help="JSONL shard folder")
+    parser.add_argument("--shards", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--checkpoint", help="defaults to ./cache/reformat-<source>-<sink>.json")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint")
+    args = parser.parse_args(argv)
+
+    if args.source == "es" and not args.index:
+        parser.error("--index or ES_CV_INDEX is required with --source es")
+    if args.source == "jsonl" and not args.input:
+        parser.error("--input is required with --source jsonl")
+    if args.checkpoint is None:
+        args.checkpoint = f"./cache/reformat-{args.source}-{args.sink}.json"
+
+    return args
+
+
+if __name__ == "__main__":
+    setup_logging()
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,52 @@
+"""
+Time convert_duration_to_dates over the golden corpus of tests/test_duration.py.
+
+    python -m benchmarks.bench_duration [--number 20000]
+
+"cold" clears the LRU cache before every call (every string is parsed),
+"warm" is the repeated-string case of bulk reformatting.
+"""
+import argparse
+import json
+import timeit
+
+from pathlib import Path
+
+from app.agent.utils import _convert_duration, convert_duration_to_dates
+
+
+GOLDEN_PATH = Path(__file__).parents[1] / "tests" / "data" / "duration_golden.json"
+
+
+def bench(durations: list[str], number: int) -> dict:
+    def cold():
+        for duration in durations:
+            _convert_duration.cache_clear()
+            convert_duration_to_dates(duration)
+
+    def warm():
+        for duration in durations:
+            convert_duration_to_dates(duration)
+
+    calls = number * len(durations)
+    results = {}
+    for name, func in (("cold", cold), ("warm", warm)):
+        seconds = min(timeit.repeat(func, number=number, repeat=3))
+        results[name] = seconds / calls * 1e6
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    golden = json.loads(GOLDEN_PATH.read_text(encoding="utf-8"))
+    durations = [duration for duration, _, _ in golden]
+    for name, usec in bench(durations, args.number).items():
+        print(f"{name}: {usec:.2f} us/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+from app.agent.budget import MIN_PART_TOKENS, clean_text, estimate_tokens, fit_text
+from app.agent.providers.ollama import OllamaExtractionProvider
+from app.core import settings
+
+
+def test_clean_text_keeps_bare_numbers():
+    text = "Page 1 of 2\n- 3 -\n2 / 5\nTeam size\n100\nSince\n2019"
+    assert clean_text(text) == "Team size\n100\nSince\n2019"
+
+
+def test_clean_text_keeps_bullets_repeated_twice():
+    bullet = "- Built REST APIs with Django and PostgreSQL"
+    text = f"Company A\n{bullet}\nCompany B\n{bullet}"
+    assert clean_text(text).count(bullet) == 2
+
+
+def test_clean_text_drops_repeated_headers():
+    header = "John Doe - Senior Engineer - john@example.com"
+    text = "\n".join(f"{header}\nPage {page} of 3\nSection {page}" for page in (1, 2, 3))
+    assert clean_text(text) == f"{header}\nSection 1\nSection 2\nSection 3"
+
+
+def test_fit_document_negative_budget(monkeypatch):
+    monkeypatch.setattr(settings, "CONTEXT_OUTPUT_TOKENS", 4096)
+    provider = OllamaExtractionProvider("model", use_vision=0)
+    provider.otps["num_ctx"] = 2048
+
+    text = "\n\n".join(f"## Section {i}\n" + "word " * 200 for i in range(20))
+    fitted = provider._fit_document(text, "prompt", "system")
+
+    assert fitted
+    assert estimate_tokens(fitted) <= MIN_PART_TOKENS
+    assert len(fitted) < len(fit_text(text, 0))
+
+
+def test_fit_text_cuts_a_single_long_line():
+    fitted = fit_text("word " * 5000, 1000)
+
+    assert fitted.startswith("word word")
+    assert estimate_tokens(fitted) <= 1000
+
+
+def test_fit_text_cuts_a_long_line_inside_a_section():
+    text = (
+        "Header line\n"
+        "## Experience\n"
+        "Short line\n"
+        + "word " * 5000
+        + "\n## Education\n"
+        + "word " * 50
+    )
+    fitted = fit_text(text, 1000)
+
+    assert fitted.startswith("Header line\n")
+    assert "## Experience\nShort line\nword word" in fitted
+    assert estimate_tokens(fitted) <= 1000
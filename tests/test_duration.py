@@ -0,0 +1,23 @@
+import json
+
+from pathlib import Path
+
+import pytest
+
+from app.agent.utils import _convert_duration, convert_duration_to_dates
+
+
+GOLDEN = json.loads(
+    (Path(__file__).parent / "data" / "duration_golden.json").read_text(encoding="utf-8")
+)
+
+
+@pytest.mark.parametrize("duration,start,end", GOLDEN)
+def test_convert_duration_to_dates(duration, start, end):
+    _convert_duration.cache_clear()
+    assert convert_duration_to_dates(duration) == (start, end)
+
+
+@pytest.mark.parametrize("duration", [None, ""])
+def test_convert_empty_duration(duration):
+    assert convert_duration_to_dates(duration) == (None, None)
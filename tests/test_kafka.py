@@ -0,0 +1,135 @@
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+from kafka.structs import TopicPartition
+
+from app.core.kafka import BatchConsumer, DeliveryError, ProducerMetrics
+
+
+TP = TopicPartition("cv", 0)
+
+
+class FakeConsumer:
+    def __init__(self):
+        self.commits = []
+        self.seeks = []
+
+    def commit(self, offsets):
+        self.commits.append({tp: meta.offset for tp, meta in offsets.items()})
+
+    def seek(self, tp, offset):
+        self.seeks.append((tp, offset))
+
+
+class FakeSendFuture:
+    def __init__(self, error):
+        self.error = error
+
+    def add_callback(self, fn, *args):
+        if self.error is None:
+            fn(*args, "metadata")
+
+    def add_errback(self, fn, *args):
+        if self.error is not None:
+            fn(*args, self.error)
+
+
+class FakeProducer:
+    """Delivers everything except to the topics in `failing`"""
+
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.sent = []
+
+    def send(self, topic, value):
+        self.sent.append(topic)
+        return FakeSendFuture(Exception("broker down") if topic in self.failing else None)
+
+
+class Consumer(BatchConsumer):
+    def __init__(self, producer=None):
+        # no brokers, only the state the offset logic works on
+        self.consumer = FakeConsumer()
+        self.producer = producer or FakeProducer()
+        self.producer_metrics = ProducerMetrics()
+        self.topic_send = "result"
+        self.topic_dead_letter = "result-dlq"
+        self._retry_executor = ThreadPoolExecutor(1)
+        self._pending = {}
+
+    def handle(self, item):
+        if item.get("fail"):
+            raise ConnectionError("api down")
+        return {"ok": True}
+
+    async def handle_async(self, item):
+        return self.handle(item)
+
+
+def done_future(exception=None):
+    future = Future()
+    if exception is None:
+        future.set_result(None)
+    else:
+        future.set_exception(exception)
+    return future
+
+
+def test_commit_done_commits_up_to_the_first_unfinished_record():
+    consumer = Consumer()
+    consumer._pending[TP] = OrderedDict(
+        [(10, done_future()), (11, done_future()), (12, Future()), (13, done_future())]
+    )
+    consumer._commit_done()
+
+    assert consumer.consumer.commits == [{TP: 12}]
+    assert list(consumer._pending[TP]) == [12, 13]
+    assert consumer.consumer.seeks == []
+
+
+def test_commit_done_rewinds_on_delivery_error():
+    consumer = Consumer()
+    consumer._pending[TP] = OrderedDict(
+        [(10, done_future()), (11, done_future(DeliveryError("dlq down"))), (12, done_future())]
+    )
+    consumer._commit_done()
+
+    assert consumer.consumer.commits == [{TP: 11}]
+    assert consumer.consumer.seeks == [(TP, 11)]
+    assert not consumer._pending[TP]
+
+
+@pytest.mark.parametrize(
+    "failing,committed,seeks",
+    [
+        ((), [{TP: 11}], []),
+        (("result-dlq",), [], [(TP, 10)]),
+    ],
+)
+def test_handler_failure_goes_to_dead_letter_before_commit(failing, committed, seeks):
+    producer = FakeProducer(failing)
+    consumer = Consumer(producer)
+    done = Future()
+    consumer._pending[TP] = OrderedDict([(10, done)])
+
+    consumer._process({"fail": True}, done)
+    consumer._commit_done()
+
+    assert producer.sent == ["result-dlq"]
+    assert consumer.consumer.commits == committed
+    assert consumer.consumer.seeks == seeks
+
+
+def test_handled_record_is_committed_after_delivery():
+    producer = FakeProducer()
+    consumer = Consumer(producer)
+    done = Future()
+    consumer._pending[TP] = OrderedDict([(10, done)])
+
+    consumer._process({"id": 1}, done)
+    consumer._commit_done()
+
+    assert producer.sent == ["result"]
+    assert consumer.consumer.commits == [{TP: 11}]
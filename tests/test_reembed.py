@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+from app import reembed
+
+
+class FakeIndices:
+    def __init__(self, calls, is_alias):
+        self.calls = calls
+        self.is_alias = is_alias
+
+    async def exists_alias(self, name):
+        return self.is_alias
+
+    async def get_alias(self, name):
+        return {"cv-v1": {}}
+
+    async def exists(self, index):
+        return index == "cv"
+
+    async def get(self, index, allow_no_indices):
+        return {"cv-v1": {}} if self.is_alias else {}
+
+    async def create(self, index, **kwargs):
+        self.calls.append(("create", index))
+
+    async def get_settings(self, index):
+        return {index: {"settings": {"index": {"number_of_replicas": "1"}}}}
+
+    async def get_field_mapping(self, fields, index):
+        return {index: {"mappings": {"id": {"mapping": {"id": {"type": "keyword"}}}}}}
+
+    async def put_settings(self, index, settings):
+        self.calls.append(("put_settings", index, settings))
+
+    async def refresh(self, index):
+        self.calls.append(("refresh", index))
+
+    async def update_aliases(self, actions):
+        self.calls.append(("update_aliases", actions))
+
+    async def delete(self, index):
+        self.calls.append(("delete", index))
+
+
+class FakeClient:
+    def __init__(self, is_alias):
+        self.calls = []
+        self.indices = FakeIndices(self.calls, is_alias)
+
+    async def count(self, index):
+        return {"count": 0}
+
+    async def open_point_in_time(self, index, keep_alive):
+        return {"id": "pit"}
+
+    async def close_point_in_time(self, id):
+        pass
+
+    async def search(self, query, **kwargs):
+        self.calls.append(("search", query))
+        return {"hits": {"hits": []}}
+
+
+class FakeEsClient:
+    def __init__(self, client):
+        self.client = client
+
+    def get(self):
+        return self.client
+
+    async def close(self):
+        pass
+
+
+class FakeEmbeddingManager:
+    async def init_model(self):
+        return self
+
+    async def check_model(self):
+        pass
+
+
+def run(monkeypatch, tmp_path, is_alias, delete_old):
+    client = FakeClient(is_alias)
+    monkeypatch.setattr(reembed, "es_client", FakeEsClient(client))
+    monkeypatch.setattr(reembed, "EmbeddingManager", FakeEmbeddingManager)
+
+    argv = ["--alias", "cv", "--checkpoint", str(tmp_path / "reembed.json")]
+    if delete_old:
+        argv.append("--delete-old")
+    asyncio.run(reembed.run(reembed.parse_args(argv)))
+
+    return client.calls
+
+
+def block_calls(calls):
+    return [
+        (call[1], call[2]["index.blocks.write"])
+        for call in calls
+        if call[0] == "put_settings" and "index.blocks.write" in call[2]
+    ]
+
+
+@pytest.mark.parametrize("is_alias,delete_old", [(True, False), (True, True), (False, True)])
+def test_last_catch_up_runs_blocked_before_the_swap(monkeypatch, tmp_path, is_alias, delete_old):
+    calls = run(monkeypatch, tmp_path, is_alias, delete_old)
+    source = "cv-v1" if is_alias else "cv"
+
+    names = [call[0] for call in calls]
+    block = calls.index(("put_settings", source, {"index.blocks.write": True}))
+    swap = names.index("update_aliases")
+    # a refreshed, blocked source is read once more before the swap
+    assert calls[block + 1] == ("refresh", source)
+    assert "search" in names[block:swap]
+    # nothing is read after the swap, no write can have reached the source
+    assert "search" not in names[swap:]
+
+    if is_alias and not delete_old:
+        assert block_calls(calls) == [(source, True), (source, None)]
+    else:
+        assert block_calls(calls) == [(source, True)]
+
+
+def test_catch_up_includes_updated_documents(monkeypatch, tmp_path):
+    calls = run(monkeypatch, tmp_path, True, False)
+    catch_up = [call[1] for call in calls if call[0] == "search"][-1]
+
+    assert "updated_at" in str(catch_up)
+    assert "created_at" in str(catch_up)
@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+
+from app import reformat
+from app.reformat import EsSink, Progress, es_source, id_sort_field
+
+
+TEXT_ID = {"cv-v1": {"mappings": {
+    "id": {"full_name": "id", "mapping": {"id": {"type": "text"}}},
+    "id.keyword": {"full_name": "id.keyword", "mapping": {"keyword": {"type": "keyword"}}},
+}}}
+KEYWORD_ID = {"cv-v2": {"mappings": {
+    "id": {"full_name": "id", "mapping": {"id": {"type": "keyword"}}},
+}}}
+NO_ID = {"cv-v3": {"mappings": {}}}
+
+
+class FakeIndices:
+    def __init__(self, field_mapping):
+        self.field_mapping = field_mapping
+
+    async def get_field_mapping(self, fields, index):
+        return self.field_mapping
+
+
+class FakeClient:
+    """Serves `docs` sorted by `id` one page per search"""
+
+    def __init__(self, field_mapping, docs):
+        self.indices = FakeIndices(field_mapping)
+        self.docs = docs
+        self.searches = []
+        self.closed = False
+
+    async def count(self, index, query):
+        return {"count": len(self.docs)}
+
+    async def open_point_in_time(self, index, keep_alive):
+        return {"id": "pit"}
+
+    async def close_point_in_time(self, id):
+        self.closed = True
+
+    async def search(self, query, sort, search_after, size, **kwargs):
+        self.searches.append({"query": query, "sort": sort, "search_after": search_after})
+        hits = [
+            {"_index": "cv-v1", "_id": f"doc-{i}", "_source": source, "sort": [source["id"], i]}
+            for i, source in enumerate(self.docs)
+        ]
+        if search_after:
+            hits = [hit for hit in hits if hit["sort"] > search_after]
+        return {"pit_id": "pit", "hits": {"hits": hits[:size]}}
+
+
+async def collect(client, position=None, batch_size=2):
+    return [
+        batch async for batch in es_source(client, "cv", batch_size, position, Progress())
+    ]
+
+
+@pytest.mark.parametrize(
+    "field_mapping,expected",
+    [
+        (TEXT_ID, "id.keyword"),
+        (KEYWORD_ID, "id"),
+        ({**KEYWORD_ID, **NO_ID}, "id"),
+        ({**TEXT_ID, **KEYWORD_ID}, None),
+        (NO_ID, None),
+    ],
+)
+def test_id_sort_field(field_mapping, expected):
+    client = FakeClient(field_mapping, [])
+    assert asyncio.run(id_sort_field(client, "cv")) == expected
+
+
+def test_es_source_sorts_on_keyword_and_skips_missing_raw():
+    docs = [
+        {"id": "a", "info_extract_raw": {"name": "A"}},
+        {"id": "b"},
+        {"id": "c", "info_extract_raw": {"name": "C"}},
+    ]
+    client = FakeClient(TEXT_ID, docs)
+    batches = asyncio.run(collect(client))
+
+    assert [[r["id"] for r in records] for records, _ in batches] == [["a"], ["c"]]
+    assert [position for _, position in batches] == [{"id": "b"}, {"id": "c"}]
+    assert client.searches[0]["sort"] == [{"id.keyword": "asc"}, {"_shard_doc": "asc"}]
+    # the stored-only field can not be queried
+    assert "info_extract_raw" not in str(client.searches[0]["query"])
+    assert client.closed
+
+
+def test_es_source_resumes_after_checkpointed_id():
+    docs = [{"id": i, "info_extract_raw": {}} for i in "abc"]
+    client = FakeClient(KEYWORD_ID, docs)
+    asyncio.run(collect(client, position={"id": "b"}))
+
+    assert client.searches[0]["search_after"] == ["b", -1]
+
+
+def test_es_source_without_sortable_id_pages_on_shard_doc():
+    docs = [{"id": "a", "info_extract_raw": {}}]
+    client = FakeClient(NO_ID, docs)
+    batches = asyncio.run(collect(client, position={"id": "x"}))
+
+    assert client.searches[0]["sort"] == [{"_shard_doc": "asc"}]
+    assert client.searches[0]["search_after"] is None
+    assert batches == [([{"id": "a", "_id": "doc-0", "_index": "cv-v1", "raw": {}}], None)]
+
+
+@pytest.mark.parametrize(
+    "sink_index,updated,failed",
+    [("cv", ["cv-v1", "cv"], 1), (None, ["cv-v1"], 2)],
+)
+def test_es_sink_falls_back_to_the_sink_index(monkeypatch, sink_index, updated, failed):
+    actions = []
+
+    async def fake_bulk(client, bulk_actions, **kwargs):
+        for action in bulk_actions:
+            actions.append(action)
+            yield True, {}
+
+    monkeypatch.setattr(reformat, "async_streaming_bulk", fake_bulk)
+    results = [
+        {"id": "a", "_id": "1", "_index": "cv-v1", "info_extract": {}},
+        {"id": "b", "_id": "2", "info_extract": {}},
+        {"id": "c", "info_extract": {}},
+        {"id": "d", "error": "ValueError"},
+    ]
+    sink = EsSink(None, 10, sink_index)
+
+    assert asyncio.run(sink.write(results)) == failed
+    assert [action["_index"] for action in actions] == updated